@@ -0,0 +1,283 @@
+"""
+Cohort and engagement analytics over progress data
+
+Tables are read in keyset-paged chunks straight into one NumPy array per
+column (no ORM objects), and every metric is computed with vectorised
+array operations, so millions of progress rows take seconds rather than
+minutes. Reports are cached per process by ReportCache and refreshed in the
+background once stale.
+
+Time-to-complete uses Progress.updated_at of completed rows as the
+completion time, which is the closest timestamp the schema records.
+"""
+import threading
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+# Integer value of NaT once dates are stored as days since 1970-01-01
+NO_DAY = np.iinfo(np.int64).min
+EPOCH = date(1970, 1, 1)
+
+
+def extract_columns(session, columns, id_column, chunk_size=50000, filters=()):
+    """Read a table into {name: ndarray}, `chunk_size` rows at a time.
+
+    `columns` maps names to (column, kind) with kind 'int', 'bool' or
+    'day'. Ints default to -1 and days to NO_DAY when NULL. Paging on
+    `id_column` keeps every chunk an index range scan.
+    """
+    parts = {name: [] for name in columns}
+    selected = [column for column, _ in columns.values()]
+    last_id = None
+
+    while True:
+        query = session.query(id_column, *selected).filter(*filters)
+        if last_id is not None:
+            query = query.filter(id_column > last_id)
+        rows = query.order_by(id_column).limit(chunk_size).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        for position, (name, (_, kind)) in enumerate(columns.items(), start=1):
+            parts[name].append(_to_array([row[position] for row in rows], kind))
+        if len(rows) < chunk_size:
+            break
+
+    return {name: np.concatenate(chunks) if chunks else _to_array([], columns[name][1])
+            for name, chunks in parts.items()}
+
+
+def _to_array(values, kind):
+    if kind == 'day':
+        return np.array(values, dtype='datetime64[D]').astype(np.int64)
+    if kind == 'bool':
+        return np.array([bool(v) for v in values], dtype=bool)
+    return np.array([-1 if v is None else v for v in values], dtype=np.int64)
+
+
+def week_of(days):
+    """Monday-based week number; 1970-01-01 was a Thursday."""
+    return (days + 3) // 7
+
+
+def week_start(week):
+    return EPOCH + timedelta(days=int(week) * 7 - 3)
+
+
+# ============ COHORT RETENTION ============
+def cohort_retention(enroll_user, enroll_day, activity_user, activity_day, paid_users, today_day,
+                     weeks=12, max_cohorts=12):
+    """Share of each weekly sign-up cohort active N weeks after first enrolling."""
+    valid = enroll_day != NO_DAY
+    users, user_idx = np.unique(enroll_user[valid], return_inverse=True)
+    if not len(users):
+        return []
+
+    first_day = np.full(len(users), np.iinfo(np.int64).max)
+    np.minimum.at(first_day, user_idx, enroll_day[valid])
+    cohort_weeks, cohort_idx = np.unique(week_of(first_day), return_inverse=True)
+    sizes = np.bincount(cohort_idx)
+
+    # Activity of known users, as weeks since their own cohort week
+    position = np.clip(np.searchsorted(users, activity_user), 0, len(users) - 1)
+    known = (users[position] == activity_user) & (activity_day != NO_DAY)
+    position = position[known]
+    offsets = week_of(activity_day[known]) - week_of(first_day)[position]
+    in_range = (offsets >= 0) & (offsets < weeks)
+
+    # Count each user once per week, however many lessons they touched
+    pairs = np.unique(position[in_range] * weeks + offsets[in_range])
+    active = np.zeros((len(cohort_weeks), weeks), dtype=np.int64)
+    np.add.at(active, (cohort_idx[pairs // weeks], pairs % weeks), 1)
+
+    paid = np.bincount(cohort_idx, weights=np.isin(users, paid_users), minlength=len(cohort_weeks))
+    current_week = week_of(np.int64(today_day))
+
+    cohorts = []
+    for i in range(max(0, len(cohort_weeks) - max_cohorts), len(cohort_weeks)):
+        elapsed = int(current_week - cohort_weeks[i])
+        cohorts.append({
+            'week_start': week_start(cohort_weeks[i]).isoformat(),
+            'size': int(sizes[i]),
+            'paid_rate': round(float(paid[i] / sizes[i]) * 100, 1),
+            # None for weeks that have not happened yet for this cohort
+            'retention': [round(float(active[i, w] / sizes[i]) * 100, 1) if w <= elapsed else None
+                          for w in range(weeks)],
+        })
+    return cohorts[::-1]
+
+
+# ============ LESSON DROP-OFF ============
+def lesson_funnel(lesson_ids, progress_lesson, progress_completed):
+    """(started, completed) counts per lesson, aligned with `lesson_ids`."""
+    order = np.argsort(lesson_ids)
+    sorted_ids = lesson_ids[order]
+    position = np.clip(np.searchsorted(sorted_ids, progress_lesson), 0, max(len(sorted_ids) - 1, 0))
+    known = sorted_ids[position] == progress_lesson if len(sorted_ids) else np.zeros(0, dtype=bool)
+
+    started_sorted = np.bincount(position[known], minlength=len(sorted_ids))
+    completed_sorted = np.bincount(position[known], weights=progress_completed[known], minlength=len(sorted_ids))
+
+    started = np.empty_like(started_sorted)
+    completed = np.empty(len(sorted_ids), dtype=np.int64)
+    started[order] = started_sorted
+    completed[order] = completed_sorted.astype(np.int64)
+    return started, completed
+
+
+def lesson_dropoff(lessons, started, completed):
+    """Per-subject funnel in curriculum order: how many students reach each lesson."""
+    by_subject = {}
+    for i, lesson in enumerate(lessons):
+        rows = by_subject.setdefault(lesson['subject_id'], [])
+        previous = rows[-1]['started'] if rows else None
+        rows.append({
+            'lesson_id': lesson['id'],
+            'title': lesson['title'],
+            'week': lesson['week'],
+            'day': lesson['day'],
+            'started': int(started[i]),
+            'completed': int(completed[i]),
+            'completion_rate': round(float(completed[i] / started[i]) * 100, 1) if started[i] else None,
+            # Share of the previous lesson's students who never opened this one
+            'drop_off': round(float(1 - started[i] / previous) * 100, 1) if previous else None,
+        })
+    return by_subject
+
+
+# ============ TIME TO COMPLETE ============
+def time_to_complete(enroll_user, enroll_subject, enroll_day, progress_user, progress_subject,
+                     progress_completed, progress_day, lesson_counts):
+    """Days from enrolling to completing lessons, and to finishing whole subjects."""
+    stride = np.int64(max(int(enroll_subject.max(initial=0)), int(progress_subject.max(initial=0))) + 1)
+
+    valid = enroll_day != NO_DAY
+    keys, key_idx = np.unique(enroll_user[valid] * stride + enroll_subject[valid], return_inverse=True)
+    if not len(keys):
+        return {}
+    enrolled = np.full(len(keys), np.iinfo(np.int64).max)
+    np.minimum.at(enrolled, key_idx, enroll_day[valid])
+
+    done = progress_completed & (progress_day != NO_DAY) & (progress_subject >= 0)
+    progress_keys = progress_user[done] * stride + progress_subject[done]
+    position = np.clip(np.searchsorted(keys, progress_keys), 0, len(keys) - 1)
+    known = keys[position] == progress_keys
+    position = position[known]
+    days = progress_day[done][known] - enrolled[position]
+    valid_days = days >= 0
+    position, days = position[valid_days], days[valid_days]
+
+    # Per (user, subject): lessons completed and the day the last one was
+    completed_count = np.bincount(position, minlength=len(keys))
+    finished_after = np.full(len(keys), -1, dtype=np.int64)
+    np.maximum.at(finished_after, position, days)
+    key_subject = keys % stride
+
+    result = {}
+    for subject_id in np.unique(key_subject[position]) if len(position) else []:
+        lesson_days = days[key_subject[position] == subject_id]
+        total = lesson_counts.get(int(subject_id), 0)
+        finishers = (key_subject == subject_id) & (completed_count >= total) & (total > 0)
+        result[int(subject_id)] = {
+            'completions': int(len(lesson_days)),
+            'lesson_days_median': float(np.median(lesson_days)),
+            'lesson_days_p90': float(np.percentile(lesson_days, 90)),
+            'finishers': int(finishers.sum()),
+            'course_days_median': float(np.median(finished_after[finishers])) if finishers.any() else None,
+        }
+    return result
+
+
+def engagement_report(enrollments, progress, paid_users, lessons, today):
+    """Everything the admin analytics page shows, from extracted column arrays.
+
+    `lessons` is a list of dicts (id, subject_id, title, week, day,
+    published) in curriculum order.
+    """
+    started_at = time.time()
+    today_day = (today - EPOCH).days
+
+    lesson_ids = np.array([lesson['id'] for lesson in lessons], dtype=np.int64)
+    lesson_subjects = np.array([lesson['subject_id'] for lesson in lessons], dtype=np.int64)
+
+    # Lesson -> subject for every progress row
+    order = np.argsort(lesson_ids)
+    position = np.clip(np.searchsorted(lesson_ids[order], progress['lesson_id']), 0, max(len(order) - 1, 0))
+    if len(order):
+        found = lesson_ids[order][position] == progress['lesson_id']
+        progress_subject = np.where(found, lesson_subjects[order][position], -1)
+    else:
+        progress_subject = np.full(len(progress['lesson_id']), -1, dtype=np.int64)
+
+    # A student counts as active in a week if they enrolled, opened a subject or moved a lesson on
+    activity_user = np.concatenate([enrollments['user_id'], enrollments['user_id'], progress['user_id']])
+    activity_day = np.concatenate([enrollments['enrolled_at'], enrollments['last_accessed'], progress['updated_at']])
+
+    published = [lesson for lesson in lessons if lesson['published']]
+    published_ids = np.array([lesson['id'] for lesson in published], dtype=np.int64)
+    started, completed = lesson_funnel(published_ids, progress['lesson_id'], progress['completed'])
+
+    lesson_counts = {}
+    for lesson in published:
+        lesson_counts[lesson['subject_id']] = lesson_counts.get(lesson['subject_id'], 0) + 1
+
+    dropoff = lesson_dropoff(published, started, completed)
+    worst = sorted(
+        ({**row, 'subject_id': subject_id} for subject_id, rows in dropoff.items() for row in rows
+         if row['drop_off'] is not None),
+        key=lambda row: row['drop_off'], reverse=True
+    )[:10]
+
+    return {
+        'cohorts': cohort_retention(enrollments['user_id'], enrollments['enrolled_at'],
+                                    activity_user, activity_day, paid_users, today_day),
+        'dropoff': dropoff,
+        'worst_dropoffs': worst,
+        'time_to_complete': time_to_complete(
+            enrollments['user_id'], enrollments['subject_id'], enrollments['enrolled_at'],
+            progress['user_id'], progress_subject, progress['completed'], progress['updated_at'],
+            lesson_counts),
+        'rows': {'enrollments': int(len(enrollments['user_id'])), 'progress': int(len(progress['user_id']))},
+        'seconds': round(time.time() - started_at, 2),
+    }
+
+
+# ============ CACHE ============
+class ReportCache:
+    """Keeps the last report; serves it while a stale one is rebuilt in the background."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.value = None
+        self.computed_at = None
+        self.refreshing = False
+        self._lock = threading.Lock()
+
+    def get(self, compute, force=False):
+        with self._lock:
+            value, computed_at = self.value, self.computed_at
+            stale = computed_at is None or time.time() - computed_at > self.ttl
+            start_background = stale and value is not None and not force and not self.refreshing
+            if start_background:
+                self.refreshing = True
+
+        if value is None or force:
+            self._store(compute())
+        elif start_background:
+            threading.Thread(target=self._refresh, args=(compute,), daemon=True).start()
+        return self.value, self.computed_at
+
+    def _refresh(self, compute):
+        try:
+            self._store(compute())
+        finally:
+            with self._lock:
+                self.refreshing = False
+
+    def _store(self, value):
+        with self._lock:
+            self.value = value
+            self.computed_at = time.time()
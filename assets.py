@@ -0,0 +1,103 @@
+"""
+Fingerprinted static asset serving
+
+build_assets.py writes minified, content-hashed copies of static/ into
+static/dist/ plus a manifest.json. Once init_app() has run, a plain
+url_for('static', filename='mobile-base.css') resolves to the hashed file,
+the precompressed .br/.gz sibling is sent when the browser accepts it, and
+hashed files are cached for a year. Without a manifest (local development)
+the original files are served unchanged.
+"""
+import os
+import json
+import mimetypes
+
+from flask import request, send_from_directory
+
+DIST_FOLDER = 'dist'
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Preferred order when the browser accepts several encodings
+ENCODING_SUFFIXES = [('br', '.br'), ('gzip', '.gz')]
+
+
+class AssetManifest:
+    def __init__(self, static_folder):
+        self.dist_folder = os.path.join(static_folder, DIST_FOLDER)
+        self.path = os.path.join(self.dist_folder, 'manifest.json')
+        self.assets = {}
+        self.hashed = {}
+        self.mtime = None
+        self.reload()
+
+    def reload(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            self.assets, self.hashed, self.mtime = {}, {}, None
+            return
+
+        if mtime == self.mtime:
+            return
+
+        with open(self.path) as f:
+            assets = json.load(f).get('assets', {})
+        self.assets = assets
+        self.hashed = {entry['file']: entry for entry in assets.values()}
+        self.mtime = mtime
+
+    def hashed_filename(self, filename):
+        entry = self.assets.get(filename)
+        return f"{DIST_FOLDER}/{entry['file']}" if entry else None
+
+    def lookup_hashed(self, filename):
+        """Return the manifest entry for a 'dist/...' filename, if it is one."""
+        prefix = DIST_FOLDER + '/'
+        if not filename or not filename.startswith(prefix):
+            return None
+        return self.hashed.get(filename[len(prefix):])
+
+
+def init_app(app):
+    manifest = AssetManifest(app.static_folder)
+    app.extensions['asset_manifest'] = manifest
+
+    @app.url_defaults
+    def fingerprint_static_url(endpoint, values):
+        if endpoint != 'static' or not manifest.assets:
+            return
+        hashed = manifest.hashed_filename(values.get('filename'))
+        if hashed:
+            values['filename'] = hashed
+
+    @app.before_request
+    def serve_precompressed_asset():
+        if app.debug:
+            manifest.reload()
+
+        if request.endpoint != 'static':
+            return None
+
+        entry = manifest.lookup_hashed((request.view_args or {}).get('filename'))
+        if not entry:
+            return None
+
+        for encoding, suffix in ENCODING_SUFFIXES:
+            if encoding in entry['encodings'] and request.accept_encodings[encoding]:
+                response = send_from_directory(
+                    manifest.dist_folder,
+                    entry['file'] + suffix,
+                    mimetype=mimetypes.guess_type(entry['file'])[0],
+                )
+                response.headers['Content-Encoding'] = encoding
+                return response
+        return None
+
+    @app.after_request
+    def cache_hashed_assets(response):
+        if request.endpoint == 'static' and manifest.lookup_hashed((request.view_args or {}).get('filename')):
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+            response.vary.add('Accept-Encoding')
+        return response
+
+    return manifest
@@ -0,0 +1,212 @@
+"""
+Append-only audit trail with batched database writes
+
+record() appends one JSON line to this process's open segment file
+(audit-<pid>-<started>-<n>.open) and returns; the admin request never
+waits on the database. A background thread closes the segment every flush interval
+(renaming it to .ready) and compacts ready segments into the audit table
+with one multi-row INSERT per segment, then deletes them.
+
+Nothing is lost when a worker is recycled or killed: its segments stay on
+disk and any other process compacts them once their writer is gone. File
+names carry the writer's pid and start stamp, so a restarted container
+that reuses the same small pids does not mistake a dead worker's segments
+for its own or for a live process's. Every
+entry carries a random event_id, and rows already in the table are
+skipped, so a segment compacted twice (a crash between INSERT and delete)
+does not duplicate entries.
+"""
+import os
+import glob
+import json
+import time
+import uuid
+import atexit
+import threading
+from datetime import datetime
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _process_started(pid):
+    """Epoch seconds when `pid` started, from /proc (None where that is unavailable)."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # Fields after the parenthesised command name; starttime is field 22
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/stat') as f:
+            boot = next(int(line.split()[1]) for line in f if line.startswith('btime '))
+    except (OSError, IndexError, ValueError, StopIteration):
+        return None
+    return boot + start_ticks / os.sysconf('SC_CLK_TCK')
+
+
+def _writer_alive(pid, started):
+    """Whether the process that stamped a segment `started` (ms) is still running as `pid`.
+
+    A live pid only counts if that process was already running at the stamp;
+    one started later is a different process that reused the pid.
+    """
+    if not _pid_alive(pid):
+        return False
+    process_started = _process_started(pid)
+    # boot time has whole-second resolution
+    return process_started is None or process_started <= started / 1000 + 1
+
+
+def _segment_owner(name):
+    """(pid, started) from audit-<pid>-<started>-<n>.* or compacting-<pid>-<started>-<segment>.ndjson."""
+    _, pid, started = name.split('-')[:3]
+    return int(pid), int(started)
+
+
+def changes(before, after):
+    """{field: [old, new]} for the fields whose value differs between two snapshots."""
+    return {field: [before.get(field), value] for field, value in after.items() if before.get(field) != value}
+
+
+class AuditLog:
+    def __init__(self, directory, flush_interval=5.0, fsync=False):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._pid = None
+        self._file = None
+        self._path = None
+        self._sequence = 0
+        self._started = 0
+        self._insert_rows = None
+        self._thread = None
+        self.recorded = 0
+        self.compacted = 0
+        self.errors = 0
+        os.makedirs(directory, exist_ok=True)
+        atexit.register(self.close)
+
+    def start(self, insert_rows):
+        """Compact segments with `insert_rows(rows)`, which returns the event_ids it stored."""
+        self._insert_rows = insert_rows
+
+    def record(self, action, **entry):
+        entry = {'event_id': uuid.uuid4().hex, 'created_at': datetime.utcnow().isoformat(),
+                 'action': action, **entry}
+        line = json.dumps(entry, default=str, separators=(',', ':')) + '\n'
+        with self._lock:
+            self._ensure_process()
+            if self._file is None:
+                self._sequence += 1
+                self._path = os.path.join(self.directory,
+                                          f"audit-{self._pid}-{self._started}-{self._sequence}.open")
+                self._file = open(self._path, 'a', encoding='utf-8')
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self.recorded += 1
+        return entry['event_id']
+
+    def ensure_running(self):
+        """Start this process's compactor, even if it has not recorded anything yet."""
+        with self._lock:
+            self._ensure_process()
+
+    def _ensure_process(self):
+        # After a fork the parent's file handle and thread are not ours
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            # Distinguishes this process's segments from those of an earlier one with the same pid
+            self._started = int(time.time() * 1000)
+            self._file = self._path = None
+            self._thread = threading.Thread(target=self._run, name='audit-compactor', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠️ Audit compaction failed, will retry: {e}")
+
+    def _rotate(self):
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.close()
+            os.replace(self._path, self._path[:-len('.open')] + '.ready')
+            self._file = self._path = None
+
+    def _claimable(self):
+        """Segments to compact: closed ones, plus any a dead process was writing or compacting."""
+        paths = glob.glob(os.path.join(self.directory, 'audit-*.ready'))
+        for path in glob.glob(os.path.join(self.directory, 'audit-*.open')) + \
+                glob.glob(os.path.join(self.directory, 'compacting-*')):
+            pid, started = _segment_owner(os.path.basename(path))
+            if pid == self._pid:
+                # Same pid but another stamp: an earlier process that had this pid
+                alive = started == self._started
+            else:
+                alive = _writer_alive(pid, started)
+            if not alive:
+                paths.append(path)
+        return sorted(paths)
+
+    def flush(self):
+        """Close this process's segment and store every claimable segment; returns entries stored."""
+        self.ensure_running()
+        self._rotate()
+        if self._insert_rows is None:
+            return 0
+        stored = 0
+        for path in self._claimable():
+            name = os.path.basename(path)
+            if name.startswith('compacting-'):
+                name = name.split('-', 3)[3]
+            segment = os.path.splitext(name)[0]
+            claimed = os.path.join(self.directory, f"compacting-{self._pid}-{self._started}-{segment}.ndjson")
+            try:
+                # Renaming claims the segment; another worker compacting at the same time gets ENOENT
+                os.replace(path, claimed)
+            except FileNotFoundError:
+                continue
+            rows = []
+            with open(claimed, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        rows.append(json.loads(line))
+                    except ValueError:
+                        # A torn last line from a killed process
+                        continue
+            if rows:
+                try:
+                    stored += len(self._insert_rows(rows))
+                except Exception:
+                    os.replace(claimed, os.path.join(self.directory, f"{segment}.ready"))
+                    raise
+            os.remove(claimed)
+        self.compacted += stored
+        return stored
+
+    def pending(self):
+        return len(glob.glob(os.path.join(self.directory, 'audit-*')) +
+                   glob.glob(os.path.join(self.directory, 'compacting-*')))
+
+    def stats(self):
+        return {'recorded': self.recorded, 'compacted': self.compacted, 'errors': self.errors,
+                'pending_segments': self.pending()}
+
+    def close(self):
+        try:
+            self._rotate()
+        except OSError:
+            pass
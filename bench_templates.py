@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Measure template load cost for a fresh worker process
+
+Each scenario runs in a new Python process, like a freshly forked or
+recycled gunicorn worker, and times the first load of every template
+(what the first request to each page pays) and of the largest pages:
+
+- cold: no bytecode cache, every template compiled from source
+- bytecode: bytecode cache on disk (from a previous process), templates unmarshalled
+- preloaded: templates already in memory (precompiled in the master before fork)
+
+Usage:
+    python bench_templates.py
+    python bench_templates.py --runs 5
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+TEMPLATE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+LARGEST = 4
+
+WORKER = r'''
+import json, sys, time
+from jinja2 import Environment, FileSystemLoader
+import template_cache
+
+folder, cache_dir, mode = sys.argv[1:4]
+env = Environment(loader=FileSystemLoader(folder),
+                  bytecode_cache=template_cache.bytecode_cache(cache_dir) if mode != 'cold' else None)
+# The app's own filters, so templates that use them compile
+env.filters['format'] = lambda value, separator=',': value
+env.filters['highlight'] = lambda value, *args: value
+if mode == 'preloaded':
+    template_cache.precompile(env)
+
+timings = {}
+for name in env.list_templates(extensions=['html']):
+    started = time.perf_counter()
+    env.get_template(name)
+    timings[name] = time.perf_counter() - started
+print(json.dumps(timings))
+'''
+
+
+def run(mode, cache_dir):
+    output = subprocess.run(
+        [sys.executable, '-c', WORKER, TEMPLATE_FOLDER, cache_dir, mode],
+        check=True, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    ).stdout
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare first-load template cost with and without caching')
+    parser.add_argument('--runs', type=int, default=3, help='processes per scenario (best run is reported)')
+    args = parser.parse_args()
+
+    cache_dir = tempfile.mkdtemp(prefix='template-bench-')
+    try:
+        results = {}
+        for mode in ('cold', 'bytecode', 'preloaded'):
+            if mode == 'bytecode':
+                # Populate the on-disk cache the way a previous worker would
+                run('bytecode', cache_dir)
+            runs = [run(mode, cache_dir) for _ in range(args.runs)]
+            results[mode] = min(runs, key=lambda timings: sum(timings.values()))
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    cold = results['cold']
+    largest = sorted(cold, key=lambda name: os.path.getsize(os.path.join(TEMPLATE_FOLDER, name)), reverse=True)[:LARGEST]
+
+    print(f"📊 First load of {len(cold)} templates per fresh process (best of {args.runs}):")
+    print(f"{'':24}{'cold':>10}{'bytecode':>10}{'preloaded':>11}")
+    for name in largest:
+        print(f"{name:24}" + ''.join(f"{results[mode][name] * 1000:>{width}.1f}ms"
+                                    for mode, width in (('cold', 8), ('bytecode', 8), ('preloaded', 9))))
+    print(f"{'all templates':24}" + ''.join(f"{sum(results[mode].values()) * 1000:>{width}.1f}ms"
+                                           for mode, width in (('cold', 8), ('bytecode', 8), ('preloaded', 9))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Compare gunicorn worker models under slow I/O and slow clients
+
+Starts gunicorn with gunicorn.conf.py once per worker class (sync, gthread,
+gevent) and the same number of worker processes, then measures request
+throughput and latency while some clients download a large response slowly
+(phones on a weak connection).
+
+By default it serves a synthetic app whose /io endpoint waits 50ms (a DB
+query or payment provider call) and whose /download endpoint streams 2MB,
+so results reflect the worker model rather than this machine's database.
+Point it at the real app with --app app:app --path /subjects.
+
+Usage:
+    python bench_workers.py
+    python bench_workers.py --workers 2 --clients 64 --slow-clients 8 --seconds 10
+    python bench_workers.py --app app:app --path /subjects --download-path /static/css/mobile-base.css
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import threading
+import subprocess
+import http.client
+
+IO_WAIT = 0.05
+DOWNLOAD_BYTES = 2 * 1024 * 1024
+
+
+def synthetic_app(environ, start_response):
+    path = environ.get('PATH_INFO', '/')
+    if path == '/download':
+        start_response('200 OK', [('Content-Type', 'application/octet-stream'),
+                                  ('Content-Length', str(DOWNLOAD_BYTES))])
+        return (b'x' * 65536 for _ in range(DOWNLOAD_BYTES // 65536))
+    if path == '/cpu':
+        sum(i * i for i in range(20000))
+    else:
+        time.sleep(IO_WAIT)
+    body = b'ok'
+    start_response('200 OK', [('Content-Type', 'text/plain'), ('Content-Length', str(len(body)))])
+    return [body]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_server(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def fetch(port, path, read_delay=0.0):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        conn.request('GET', path)
+        response = conn.getresponse()
+        while True:
+            chunk = response.read(16384)
+            if not chunk:
+                break
+            if read_delay:
+                time.sleep(read_delay)
+        return response.status
+    finally:
+        conn.close()
+
+
+def run_load(port, path, download_path, clients, slow_clients, seconds):
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def client():
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                status = fetch(port, path)
+                ok = status < 500
+            except OSError:
+                ok = False
+            with lock:
+                if ok:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors[0] += 1
+
+    def slow_client():
+        while not stop.is_set():
+            try:
+                # ~16KB every 50ms: a 2MB download takes several seconds
+                fetch(port, download_path, read_delay=0.05)
+            except OSError:
+                pass
+
+    threads = [threading.Thread(target=slow_client, daemon=True) for _ in range(slow_clients)]
+    threads += [threading.Thread(target=client, daemon=True) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=30)
+
+    latencies.sort()
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else float('nan')
+
+    return {'requests': len(latencies), 'rps': len(latencies) / seconds, 'p50': percentile(0.5),
+            'p99': percentile(0.99), 'errors': errors[0]}
+
+
+def bench(worker_class, args):
+    port = free_port()
+    env = {**os.environ, 'GUNICORN_WORKER_CLASS': worker_class, 'WEB_CONCURRENCY': str(args.workers),
+           'GUNICORN_THREADS': str(args.threads), 'GUNICORN_WORKER_CONNECTIONS': str(args.connections),
+           'GUNICORN_TIMEOUT': '120'}
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}',
+         '--log-level', 'warning', args.app],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        if not wait_for_server(port):
+            return None
+        return run_load(port, args.path, args.download_path, args.clients, args.slow_clients, args.seconds)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare gunicorn worker classes under slow I/O and slow clients')
+    parser.add_argument('--app', default='bench_workers:synthetic_app', help='WSGI app to serve')
+    parser.add_argument('--path', default='/io', help='path the measured clients request')
+    parser.add_argument('--download-path', default='/download', help='large response the slow clients read')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8, help='threads per gthread worker')
+    parser.add_argument('--connections', type=int, default=200, help='greenlets per gevent worker')
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--slow-clients', type=int, default=4)
+    parser.add_argument('--seconds', type=int, default=10)
+    parser.add_argument('--classes', default='sync,gthread,gevent')
+    args = parser.parse_args()
+
+    print(f"📊 {args.workers} workers, {args.clients} clients on {args.path}, "
+          f"{args.slow_clients} slow downloads, {args.seconds}s each")
+    print(f"{'worker class':14}{'req/s':>9}{'p50':>10}{'p99':>10}{'errors':>8}")
+    for worker_class in args.classes.split(','):
+        result = bench(worker_class, args)
+        if result is None:
+            print(f"{worker_class:14}   server did not start (is it installed?)")
+            continue
+        print(f"{worker_class:14}{result['rps']:>9.1f}{result['p50']:>8.0f}ms{result['p99']:>8.0f}ms{result['errors']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Build fingerprinted static assets
+
+Minifies the CSS/JS under static/, writes content-hashed copies into
+static/dist/ with .gz (and .br when the brotli package is installed)
+siblings, and records everything in static/dist/manifest.json for assets.py.
+
+    python build_assets.py                  # build static/dist
+    python build_assets.py --extract-inline # move template <style> blocks to static/css/pages
+"""
+import os
+import sys
+import re
+import json
+import gzip
+import shutil
+import hashlib
+import argparse
+import textwrap
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+TEMPLATE_DIR = os.path.join(BASE_DIR, 'templates')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+PAGES_DIR = os.path.join(STATIC_DIR, 'css', 'pages')
+
+# Folders under static/ that are never fingerprinted
+SKIP_DIRS = {'dist', 'uploads'}
+
+FINGERPRINT_EXTENSIONS = {'.css', '.js', '.svg', '.png', '.jpg', '.jpeg', '.gif', '.ico', '.woff', '.woff2'}
+COMPRESS_EXTENSIONS = {'.css', '.js', '.svg'}
+
+# Files smaller than this are not worth a compressed sibling
+MIN_COMPRESS_SIZE = 512
+
+STYLE_BLOCK = re.compile(r'(?P<indent>[ \t]*)<style>\n?(?P<css>.*?)</style>[ \t]*\n?', re.S)
+JINJA_EXPR = re.compile(r'{{.*?}}|{%.*?%}', re.S)
+
+
+# ============ MINIFICATION ============
+def minify_css(source):
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(r'\s*([{};,>])\s*', r'\1', source)
+    source = re.sub(r':\s+', ':', source)
+    source = source.replace(';}', '}')
+    return source.strip()
+
+
+def minify_js(source):
+    # Deliberately conservative: only whole-line comments, indentation and
+    # blank lines are removed so strings, regexes and ASI are never touched.
+    lines = []
+    in_block_comment = False
+    for line in source.splitlines():
+        stripped = line.strip()
+        if in_block_comment:
+            if '*/' in stripped:
+                in_block_comment = False
+            continue
+        if stripped.startswith('/*') and not stripped.startswith('/*!'):
+            if '*/' not in stripped:
+                in_block_comment = True
+            continue
+        if not stripped or stripped.startswith('//'):
+            continue
+        lines.append(stripped)
+    return '\n'.join(lines) + '\n'
+
+
+MINIFIERS = {
+    '.css': minify_css,
+    '.js': minify_js,
+}
+
+
+# ============ BUILD ============
+def iter_sources():
+    for root, dirs, files in os.walk(STATIC_DIR):
+        rel_root = os.path.relpath(root, STATIC_DIR)
+        if rel_root == '.':
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+        for name in sorted(files):
+            ext = os.path.splitext(name)[1].lower()
+            if ext in FINGERPRINT_EXTENSIONS:
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, STATIC_DIR).replace(os.sep, '/'), path, ext
+
+
+def write_compressed(path, data):
+    encodings = []
+    if len(data) < MIN_COMPRESS_SIZE:
+        return encodings
+
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(gz) < len(data):
+        with open(path + '.gz', 'wb') as f:
+            f.write(gz)
+        encodings.append('gzip')
+
+    if brotli is not None:
+        br = brotli.compress(data, quality=11)
+        if len(br) < len(data):
+            with open(path + '.br', 'wb') as f:
+                f.write(br)
+            encodings.append('br')
+
+    return encodings
+
+
+def build(verbose=True):
+    if os.path.isdir(DIST_DIR):
+        shutil.rmtree(DIST_DIR)
+    os.makedirs(DIST_DIR)
+
+    manifest = {}
+    total_in = total_out = 0
+
+    for rel_path, path, ext in iter_sources():
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        minifier = MINIFIERS.get(ext)
+        if minifier:
+            data = minifier(data.decode('utf-8')).encode('utf-8')
+
+        digest = hashlib.md5(data).hexdigest()[:10]
+        stem, _ = os.path.splitext(rel_path)
+        hashed = f"{stem}.{digest}{ext}"
+
+        out_path = os.path.join(DIST_DIR, hashed)
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        with open(out_path, 'wb') as f:
+            f.write(data)
+
+        encodings = write_compressed(out_path, data) if ext in COMPRESS_EXTENSIONS else []
+        manifest[rel_path] = {'file': hashed, 'encodings': encodings}
+
+        original_size = os.path.getsize(path)
+        smallest = len(data)
+        if encodings:
+            smallest = min(os.path.getsize(out_path + ('.br' if e == 'br' else '.gz')) for e in encodings)
+        total_in += original_size
+        total_out += smallest
+        if verbose:
+            print(f"  {rel_path} -> dist/{hashed} ({original_size} -> {smallest} bytes)")
+
+    with open(os.path.join(DIST_DIR, 'manifest.json'), 'w') as f:
+        json.dump({'assets': manifest}, f, indent=2, sort_keys=True)
+
+    if verbose:
+        print(f"✅ {len(manifest)} assets built, {total_in} -> {total_out} bytes over the wire")
+    return manifest
+
+
+# ============ INLINE CSS EXTRACTION ============
+def split_css_rules(css):
+    """Split a stylesheet into top-level rules (an @media block counts as one)."""
+    rules = []
+    depth = 0
+    start = 0
+    masked = JINJA_EXPR.sub(lambda m: 'x' * len(m.group(0)), css)
+    for i, ch in enumerate(masked):
+        if ch == '{':
+            depth += 1
+        elif ch == '}':
+            depth -= 1
+            if depth == 0:
+                rules.append(css[start:i + 1])
+                start = i + 1
+    tail = css[start:]
+    if tail.strip():
+        rules.append(tail)
+    return rules
+
+
+def extract_inline_css(verbose=True):
+    """Move static <style> rules out of templates into cacheable stylesheets.
+
+    Rules that interpolate template variables (e.g. a subject colour) stay
+    inline, everything else goes to static/css/pages/<template>.css.
+    """
+    os.makedirs(PAGES_DIR, exist_ok=True)
+
+    for name in sorted(os.listdir(TEMPLATE_DIR)):
+        if not name.endswith('.html'):
+            continue
+        template_path = os.path.join(TEMPLATE_DIR, name)
+        with open(template_path, encoding='utf-8') as f:
+            html = f.read()
+
+        match = STYLE_BLOCK.search(html)
+        if not match:
+            continue
+
+        static_rules, dynamic_rules = [], []
+        for rule in split_css_rules(match.group('css')):
+            (dynamic_rules if JINJA_EXPR.search(rule) else static_rules).append(rule)
+        if not static_rules:
+            continue
+
+        page = name[:-len('.html')]
+        css_path = os.path.join(PAGES_DIR, page + '.css')
+        with open(css_path, 'w', encoding='utf-8') as f:
+            f.write(textwrap.dedent(''.join(static_rules)).strip('\n') + '\n')
+
+        indent = match.group('indent')
+        replacement = (f"{indent}<link rel=\"stylesheet\" "
+                       f"href=\"{{{{ url_for('static', filename='css/pages/{page}.css') }}}}\">\n")
+        if dynamic_rules:
+            replacement += f"{indent}<style>\n{''.join(dynamic_rules).strip(chr(10))}\n{indent}</style>\n"
+
+        html = html[:match.start()] + replacement + html[match.end():]
+        with open(template_path, 'w', encoding='utf-8') as f:
+            f.write(html)
+
+        if verbose:
+            kept = f", {len(dynamic_rules)} dynamic rule(s) kept inline" if dynamic_rules else ''
+            print(f"  {name} -> css/pages/{page}.css{kept}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build fingerprinted static assets')
+    parser.add_argument('--extract-inline', action='store_true',
+                        help='move template <style> blocks into static/css/pages before building')
+    parser.add_argument('-q', '--quiet', action='store_true')
+    args = parser.parse_args()
+
+    if args.extract_inline:
+        print("✂️  Extracting inline template CSS...")
+        extract_inline_css(verbose=not args.quiet)
+
+    print("📦 Building static assets...")
+    build(verbose=not args.quiet)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""
+Response compression and conditional GET middleware
+
+Wraps the WSGI app so text responses (HTML, JSON, CSS, JS) get a weak ETag,
+If-None-Match requests are answered with 304, and bodies above a size
+threshold are brotli/gzip compressed. Media, ranged and already-encoded
+responses pass through untouched, and so do streamed responses (no
+Content-Length) and bodies over max_size, which would otherwise have to be
+buffered whole. Bytes saved are counted per route.
+"""
+import gzip
+import hashlib
+import threading
+
+from werkzeug.http import parse_accept_header, parse_etags, unquote_etag
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# The app stores the matched endpoint here so stats group by route, not URL
+ROUTE_ENVIRON_KEY = 'compression.route'
+
+COMPRESSIBLE_TYPES = (
+    'text/',
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'image/svg+xml',
+)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, min_size=1024, max_size=4 * 1024 * 1024, gzip_level=6, brotli_quality=5):
+        self.app = app
+        self.min_size = min_size
+        self.max_size = max_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def __call__(self, environ, start_response):
+        captured = {}
+
+        def capture_start_response(status, headers, exc_info=None):
+            captured['status'] = status
+            captured['headers'] = headers
+            captured['exc_info'] = exc_info
+            return lambda data: captured.setdefault('written', []).append(data)
+
+        app_iter = self.app(environ, capture_start_response)
+        status, headers = captured['status'], captured['headers']
+
+        if not self._is_eligible(environ, status, headers) or captured.get('written'):
+            start_response(status, headers, captured['exc_info'])
+            return app_iter
+
+        try:
+            body = b''.join(app_iter)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+        route = environ.get(ROUTE_ENVIRON_KEY) or environ.get('PATH_INFO', '')
+        headers = [(k, v) for k, v in headers if k.lower() != 'content-length']
+
+        etag = self._get_header(headers, 'ETag')
+        if etag is None:
+            etag = 'W/"%s"' % hashlib.md5(body).hexdigest()
+            headers.append(('ETag', etag))
+            if self._get_header(headers, 'Cache-Control') is None:
+                headers.append(('Cache-Control', 'private, no-cache'))
+
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match and parse_etags(if_none_match).contains_weak(unquote_etag(etag)[0]):
+            self._record(route, len(body), 0, not_modified=True)
+            headers = [(k, v) for k, v in self._vary_on_encoding(headers) if k.lower() != 'content-type']
+            start_response('304 Not Modified', headers)
+            return [b'']
+
+        headers = self._vary_on_encoding(headers)
+        encoding = self._choose_encoding(environ) if len(body) >= self.min_size else None
+        if encoding:
+            compressed = self._compress(body, encoding)
+            if len(compressed) < len(body):
+                self._record(route, len(body), len(compressed))
+                headers.append(('Content-Encoding', encoding))
+                body = compressed
+            else:
+                self._record(route, len(body), len(body))
+        else:
+            self._record(route, len(body), len(body))
+
+        headers.append(('Content-Length', str(len(body))))
+        start_response(status, headers)
+        return [body]
+
+    def _is_eligible(self, environ, status, headers):
+        # HEAD bodies are already stripped by werkzeug, so there is nothing to hash
+        if environ.get('REQUEST_METHOD') != 'GET':
+            return False
+        if not status.startswith('200'):
+            return False
+        if self._get_header(headers, 'Content-Encoding'):
+            return False
+        if 'no-transform' in (self._get_header(headers, 'Cache-Control') or ''):
+            return False
+        content_type = (self._get_header(headers, 'Content-Type') or '').lower()
+        if not content_type.startswith(COMPRESSIBLE_TYPES):
+            return False
+        length = self._get_header(headers, 'Content-Length')
+        return length is not None and length.isdigit() and int(length) <= self.max_size
+
+    def _vary_on_encoding(self, headers):
+        # Caches must keep the encoded and plain variants apart, 304s included
+        vary = self._get_header(headers, 'Vary')
+        if vary is None:
+            return headers + [('Vary', 'Accept-Encoding')]
+        if 'accept-encoding' in vary.lower():
+            return headers
+        return [(k, v) for k, v in headers if k.lower() != 'vary'] + [('Vary', vary + ', Accept-Encoding')]
+
+    def _choose_encoding(self, environ):
+        accepted = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        if brotli is not None and accepted['br']:
+            return 'br'
+        if accepted['gzip']:
+            return 'gzip'
+        return None
+
+    def _compress(self, body, encoding):
+        if encoding == 'br':
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level)
+
+    @staticmethod
+    def _get_header(headers, name):
+        name = name.lower()
+        for key, value in headers:
+            if key.lower() == name:
+                return value
+        return None
+
+    def _record(self, route, bytes_in, bytes_out, not_modified=False):
+        with self._lock:
+            stats = self._stats.setdefault(route, {
+                'responses': 0,
+                'compressed': 0,
+                'not_modified': 0,
+                'bytes_in': 0,
+                'bytes_out': 0,
+            })
+            stats['responses'] += 1
+            stats['bytes_in'] += bytes_in
+            stats['bytes_out'] += bytes_out
+            if not_modified:
+                stats['not_modified'] += 1
+            elif bytes_out < bytes_in:
+                stats['compressed'] += 1
+
+    def stats(self):
+        with self._lock:
+            snapshot = {route: dict(values) for route, values in self._stats.items()}
+        for values in snapshot.values():
+            values['bytes_saved'] = values['bytes_in'] - values['bytes_out']
+        return snapshot
@@ -0,0 +1,35 @@
+"""
+Named counters shared by every worker process
+
+A counter is one row in the counters table. next_value() increments it
+with an UPDATE, which locks the row until the caller's transaction ends:
+another transaction bumping the same counter waits for the first to
+commit (or roll back) and then gets the following number. Values are
+therefore unique and become visible in increasing order, which "changed
+since revision N" cursors rely on. A rolled-back transaction leaves a
+gap, which is harmless.
+
+Reading MAX(column) + 1 instead is not safe: two transactions on
+PostgreSQL's READ COMMITTED both see the same maximum and hand out the
+same number.
+"""
+from sqlalchemy import text
+
+
+def ensure_counter(connection, name, start=0):
+    """Create the counters table and the `name` row, starting at `start`, if missing."""
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS counters (name VARCHAR(50) PRIMARY KEY, value BIGINT NOT NULL)"
+    ))
+    # Several workers may start at once without --preload
+    connection.execute(text(
+        "INSERT INTO counters (name, value) VALUES (:name, :start) ON CONFLICT (name) DO NOTHING"
+    ), {'name': name, 'start': start})
+
+
+def next_value(session, name):
+    """Increment counter `name` and return its new value; commit it with the change it numbers."""
+    result = session.execute(text("UPDATE counters SET value = value + 1 WHERE name = :name"), {'name': name})
+    if result.rowcount != 1:
+        raise LookupError(f"Counter '{name}' does not exist (see ensure_counter)")
+    return session.execute(text("SELECT value FROM counters WHERE name = :name"), {'name': name}).scalar()
@@ -0,0 +1,94 @@
+"""
+In-memory curriculum trees per subject
+
+A subject's published lessons grouped weeks -> days -> lessons, with
+lesson counts and durations, built once and kept in process memory. Each
+tree is tagged with the subject's content_revision; create/edit/toggle of a
+lesson bumps that number in the database, so every worker process notices
+on its next read and rebuilds, without any cross-process messaging.
+
+Trees hold plain dicts rather than ORM objects so they can be shared
+between requests and threads safely.
+"""
+import threading
+
+LESSON_COLUMNS = ('id', 'title', 'week_number', 'day_number', 'order', 'duration', 'content_type')
+
+
+def week_title(number):
+    return f"Week {number}" if number else "Unscheduled"
+
+
+def build_tree(subject_id, rows):
+    """Group lesson rows (already ordered by week, day, order) into a curriculum tree."""
+    weeks = []
+    by_week = {}
+    lesson_ids = []
+
+    for row in rows:
+        lesson = dict(zip(LESSON_COLUMNS, row))
+        lesson['duration'] = lesson['duration'] or 0
+        lesson_ids.append(lesson['id'])
+
+        week_number = lesson['week_number'] or 0
+        if not weeks or weeks[-1]['number'] != week_number:
+            weeks.append({'number': week_number, 'title': week_title(week_number),
+                          'days': [], 'lesson_count': 0, 'minutes': 0})
+            by_week[weeks[-1]['title']] = []
+        week = weeks[-1]
+
+        day_number = lesson['day_number'] or 0
+        if not week['days'] or week['days'][-1]['number'] != day_number:
+            week['days'].append({'number': day_number, 'lessons': [], 'minutes': 0})
+        day = week['days'][-1]
+
+        day['lessons'].append(lesson)
+        day['minutes'] += lesson['duration']
+        week['lesson_count'] += 1
+        week['minutes'] += lesson['duration']
+        by_week[week['title']].append(lesson)
+
+    return {
+        'subject_id': subject_id,
+        'weeks': weeks,
+        # The flat "Week N" -> lessons view the subject page renders
+        'by_week': by_week,
+        'lesson_ids': frozenset(lesson_ids),
+        'first_lesson_id': lesson_ids[0] if lesson_ids else None,
+        'lesson_count': len(lesson_ids),
+        'total_minutes': sum(week['minutes'] for week in weeks),
+    }
+
+
+class CurriculumCache:
+    def __init__(self):
+        self._trees = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, subject_id, revision, load_rows):
+        """Tree for `subject_id` at `revision`; `load_rows()` is only called on a miss."""
+        tree = self._trees.get(subject_id)
+        if tree is not None and tree['revision'] == revision:
+            with self._lock:
+                self.hits += 1
+            return tree
+
+        tree = build_tree(subject_id, load_rows())
+        tree['revision'] = revision
+        with self._lock:
+            self.misses += 1
+            self._trees[subject_id] = tree
+        return tree
+
+    def stats(self):
+        with self._lock:
+            return {'trees': len(self._trees), 'hits': self.hits, 'misses': self.misses}
+
+    def invalidate(self, subject_id=None):
+        with self._lock:
+            if subject_id is None:
+                self._trees.clear()
+            else:
+                self._trees.pop(subject_id, None)
@@ -0,0 +1,208 @@
+"""
+Database connection profile and pool metrics
+
+Builds SQLALCHEMY_ENGINE_OPTIONS for PostgreSQL from the environment:
+
+- pool size per worker process follows gunicorn's thread count (one
+  connection per request thread), with a little overflow for background
+  threads such as document extraction and the analytics refresh
+- DB_MAX_CONNECTIONS caps workers x (size + overflow) so scaling gunicorn
+  out cannot exhaust the server's connection slots
+- DB_PGBOUNCER=1 runs behind PgBouncer in transaction pooling mode: no
+  server-side prepared statements or startup parameters, which break when
+  consecutive transactions land on different server connections
+- no pre-ping round trip per checkout; connections are recycled before the
+  server/proxy idle timeout instead, and SQLAlchemy already discards the
+  pool when a query hits a dropped connection (DB_POOL_PRE_PING=1 restores it)
+
+PoolMetrics counts checkouts, time spent waiting for a free connection,
+timeouts and how long requests hold connections, per worker process.
+"""
+import os
+import re
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+# Checkouts that waited longer than this count as contended
+SLOW_WAIT_SECONDS = 0.01
+
+
+def _env_int(environ, name, default=None):
+    value = environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+
+def gunicorn_concurrency(environ=os.environ):
+    """(workers, threads per worker) from the same variables gunicorn reads."""
+    args = environ.get('GUNICORN_CMD_ARGS', '')
+
+    def from_args(*flags):
+        for flag in flags:
+            match = re.search(rf'(?:^|\s){re.escape(flag)}[=\s]+(\d+)', args)
+            if match:
+                return int(match.group(1))
+        return None
+
+    workers = from_args('--workers', '-w') or _env_int(environ, 'WEB_CONCURRENCY', 1)
+    threads = from_args('--threads') or _env_int(environ, 'GUNICORN_THREADS', 1)
+    return max(1, workers), max(1, threads)
+
+
+def pool_profile(environ=os.environ):
+    """Pool size and overflow per worker process, within the DB_MAX_CONNECTIONS budget."""
+    workers, threads = gunicorn_concurrency(environ)
+    size = _env_int(environ, 'DB_POOL_SIZE', threads)
+    overflow = _env_int(environ, 'DB_MAX_OVERFLOW', max(2, size // 2))
+
+    max_connections = _env_int(environ, 'DB_MAX_CONNECTIONS')
+    warning = None
+    if max_connections:
+        # Leave room for CLI scripts, the extraction worker and psql sessions
+        reserved = _env_int(environ, 'DB_RESERVED_CONNECTIONS', 5)
+        per_worker = max(1, (max_connections - reserved) // workers)
+        if size + overflow > per_worker:
+            warning = (f"{workers} worker(s) x {size + overflow} connections exceeds "
+                       f"DB_MAX_CONNECTIONS={max_connections}; using {per_worker} per worker")
+            size = min(size, per_worker)
+            overflow = per_worker - size
+
+    return {'workers': workers, 'threads': threads, 'pool_size': size,
+            'max_overflow': overflow, 'warning': warning}
+
+
+def engine_options(database_url, environ=os.environ):
+    """SQLALCHEMY_ENGINE_OPTIONS for `database_url`; empty for SQLite, which needs no pool tuning."""
+    if not database_url or not database_url.startswith('postgresql'):
+        return {}
+
+    profile = pool_profile(environ)
+    pgbouncer = environ.get('DB_PGBOUNCER', '0') == '1'
+    options = {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': profile['pool_size'],
+        'max_overflow': profile['max_overflow'],
+        'pool_timeout': _env_int(environ, 'DB_POOL_TIMEOUT', 10),
+        # Below Render's and PgBouncer's idle timeouts, so recycled connections never arrive dead
+        'pool_recycle': _env_int(environ, 'DB_POOL_RECYCLE', 280),
+        'pool_pre_ping': environ.get('DB_POOL_PRE_PING', '0') == '1',
+        # Reuse the most recent connection so surplus ones go idle and get recycled
+        'pool_use_lifo': True,
+        'connect_args': {'connect_timeout': _env_int(environ, 'DB_CONNECT_TIMEOUT', 5)},
+    }
+
+    if pgbouncer:
+        # psycopg 3 prepares repeated statements server-side; psycopg2 never does
+        if database_url.startswith('postgresql+psycopg:'):
+            options['connect_args']['prepare_threshold'] = None
+    else:
+        statement_timeout = _env_int(environ, 'DB_STATEMENT_TIMEOUT_MS')
+        if statement_timeout:
+            # Startup parameters are rejected by PgBouncer, so only sent to Postgres directly
+            options['connect_args']['options'] = f"-c statement_timeout={statement_timeout}"
+
+    return options
+
+
+# ============ METRICS ============
+class PoolMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked_out = {}
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.wait_seconds = 0.0
+            self.max_wait_seconds = 0.0
+            self.slow_waits = 0
+            self.timeouts = 0
+            self.connects = 0
+            self.invalidations = 0
+            self.in_use = 0
+            self.peak_in_use = 0
+            self.hold_seconds = 0.0
+            self.max_hold_seconds = 0.0
+
+    def record_wait(self, seconds, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+            if seconds > SLOW_WAIT_SECONDS:
+                self.slow_waits += 1
+
+    def attach(self, engine):
+        """Listen to checkout/checkin events of `engine`'s pool."""
+        @event.listens_for(engine, 'connect')
+        def on_connect(dbapi_connection, connection_record):
+            with self._lock:
+                self.connects += 1
+
+        @event.listens_for(engine, 'checkout')
+        def on_checkout(dbapi_connection, connection_record, connection_proxy):
+            with self._lock:
+                self.checkouts += 1
+                self.in_use += 1
+                self.peak_in_use = max(self.peak_in_use, self.in_use)
+                self._checked_out[id(connection_record)] = time.perf_counter()
+
+        @event.listens_for(engine, 'checkin')
+        def on_checkin(dbapi_connection, connection_record):
+            with self._lock:
+                started = self._checked_out.pop(id(connection_record), None)
+                if started is None:
+                    return
+                self.in_use -= 1
+                held = time.perf_counter() - started
+                self.hold_seconds += held
+                self.max_hold_seconds = max(self.max_hold_seconds, held)
+
+        @event.listens_for(engine, 'invalidate')
+        def on_invalidate(dbapi_connection, connection_record, exception):
+            with self._lock:
+                self.invalidations += 1
+
+    def snapshot(self, pool=None):
+        with self._lock:
+            data = {
+                'pid': os.getpid(),
+                'checkouts': self.checkouts,
+                'wait_ms_avg': round(self.wait_seconds / self.checkouts * 1000, 2) if self.checkouts else 0,
+                'wait_ms_max': round(self.max_wait_seconds * 1000, 2),
+                'slow_waits': self.slow_waits,
+                'timeouts': self.timeouts,
+                'connects': self.connects,
+                'invalidations': self.invalidations,
+                'in_use': self.in_use,
+                'peak_in_use': self.peak_in_use,
+                'hold_ms_avg': round(self.hold_seconds / self.checkouts * 1000, 2) if self.checkouts else 0,
+                'hold_ms_max': round(self.max_hold_seconds * 1000, 2),
+            }
+        if isinstance(pool, QueuePool):
+            data['pool'] = {'size': pool.size(), 'checked_in': pool.checkedin(),
+                            'checked_out': pool.checkedout(), 'overflow': pool.overflow()}
+        return data
+
+
+metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that times how long each checkout waits for a free connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            metrics.record_wait(time.perf_counter() - started, timed_out=True)
+            raise
+        metrics.record_wait(time.perf_counter() - started)
+        return connection
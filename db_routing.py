@@ -0,0 +1,150 @@
+"""
+Read-replica routing
+
+With DATABASE_REPLICA_URL set, SELECTs issued while handling a route
+decorated with @read_only go to the replica; everything else (writes,
+SELECT ... FOR UPDATE, undecorated routes, CLI scripts) uses the primary.
+
+A read-only request still falls back to the primary when:
+
+- it has written anything itself (flush, UPDATE/DELETE, raw DML)
+- use_primary() was called, e.g. before rebuilding data that gets saved
+- the replica is unreachable or more than REPLICA_MAX_LAG_SECONDS behind
+- this user committed a write in the last REPLICA_READ_YOUR_WRITES_SECONDS
+  (or the current replica lag, if longer), so nobody sees their own
+  payment or progress disappear after a redirect
+
+To try it locally, copy threefold.db to replica.db and start the app with
+DATABASE_REPLICA_URL=sqlite:///replica.db; pages behind @read_only then
+show the copy until the guard window after a write.
+"""
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, g, has_app_context, has_request_context, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.elements import TextClause
+
+REPLICA_BIND = 'replica'
+
+# Seconds the replica is behind; 0 on a primary or when fully replayed
+POSTGRES_LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+
+def read_only(f):
+    """Route decorator: serve this request's reads from the replica when it is safe."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.db_read_only = True
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def use_primary():
+    """Send the rest of this request's reads to the primary."""
+    if has_app_context():
+        g.db_read_only = False
+
+
+def _is_read(clause):
+    if isinstance(clause, Select):
+        return clause._for_update_arg is None
+    if isinstance(clause, TextClause):
+        return clause.text.lstrip().lower().startswith(('select', 'with'))
+    return False
+
+
+class ReplicaMonitor:
+    """Replica lag, measured at most once per interval per process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.lag = None
+        self.checked_at = 0.0
+        self.error = None
+        self.replica_reads = 0
+        self.primary_fallbacks = 0
+
+    def current_lag(self, engine, interval):
+        with self._lock:
+            if time.time() - self.checked_at < interval:
+                return self.lag
+            self.checked_at = time.time()
+
+        try:
+            with engine.connect() as connection:
+                if engine.dialect.name == 'postgresql':
+                    lag = float(connection.execute(text(POSTGRES_LAG_QUERY)).scalar() or 0)
+                else:
+                    connection.execute(text('SELECT 1'))
+                    lag = 0.0
+            error = None
+        except Exception as e:
+            lag, error = None, str(e)
+            print(f"⚠️ Read replica unavailable, reading from primary: {e}")
+
+        with self._lock:
+            self.lag, self.error = lag, error
+        return lag
+
+    def count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            return {'lag_seconds': self.lag, 'checked_at': self.checked_at or None, 'error': self.error,
+                    'replica_reads': self.replica_reads, 'primary_fallbacks': self.primary_fallbacks}
+
+
+monitor = ReplicaMonitor()
+
+
+def _replica_ok(engine):
+    """Decide once per request whether its reads may use the replica."""
+    if 'db_replica_ok' in g:
+        return g.db_replica_ok
+
+    config = current_app.config
+    lag = monitor.current_lag(engine, config.get('REPLICA_LAG_CHECK_SECONDS', 5))
+    ok = lag is not None and lag <= config.get('REPLICA_MAX_LAG_SECONDS', 10)
+    if ok and has_request_context():
+        wrote_at = flask_session.get('db_write_at')
+        guard = max(config.get('REPLICA_READ_YOUR_WRITES_SECONDS', 15), lag)
+        ok = not wrote_at or time.time() - wrote_at >= guard
+
+    g.db_replica_ok = ok
+    if not ok:
+        monitor.count('primary_fallbacks')
+    return ok
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that sends safe reads of @read_only requests to the replica."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            if self._flushing or (clause is not None and not _is_read(clause)):
+                g.db_wrote = True
+            elif g.get('db_read_only') and not g.get('db_wrote'):
+                replica = self._db.engines.get(REPLICA_BIND)
+                if replica is not None and _replica_ok(replica):
+                    monitor.count('replica_reads')
+                    return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def remember_write(session):
+    # Start this user's read-your-writes window
+    if has_request_context() and g.get('db_wrote') and REPLICA_BIND in session._db.engines:
+        flask_session['db_write_at'] = time.time()
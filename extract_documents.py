@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Extract text, page counts and thumbnails from uploaded lesson documents
+
+Queues every PDF/document lesson that has never been extracted (plus failed
+ones with --retry-failed) and processes them in a parallel process pool.
+
+    python extract_documents.py              # process the backlog
+    python extract_documents.py --workers 4
+    python extract_documents.py --watch      # keep polling for new uploads
+"""
+import sys
+import time
+import argparse
+
+
+def queue_backlog(retry_failed):
+    from app import db, Lesson, LessonDocument, DOCUMENT_CONTENT_TYPES, queue_document_extraction
+
+    statuses = ['failed'] if retry_failed else []
+    lessons = Lesson.query.outerjoin(LessonDocument).filter(
+        Lesson.content_type.in_(DOCUMENT_CONTENT_TYPES),
+        Lesson.file_path.isnot(None),
+        db.or_(LessonDocument.id.is_(None), LessonDocument.status.in_(statuses))
+    ).all()
+
+    for lesson in lessons:
+        queue_document_extraction(lesson)
+    db.session.commit()
+    return len(lessons)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract text from uploaded lesson documents')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: CPU count)')
+    parser.add_argument('--retry-failed', action='store_true', help='also retry documents that failed before')
+    parser.add_argument('--watch', action='store_true', help='keep running and poll for new uploads')
+    parser.add_argument('--interval', type=int, default=30, help='seconds between polls with --watch')
+    args = parser.parse_args()
+
+    # Imported here so spawned pool workers do not initialise the whole app
+    from app import app, process_pending_documents
+
+    with app.app_context():
+        queued = queue_backlog(args.retry_failed)
+        print(f"📄 {queued} document(s) added to the extraction queue")
+
+        while True:
+            started = time.time()
+            processed = process_pending_documents(workers=args.workers, verbose=True)
+            if processed:
+                print(f"✅ Extracted {processed} document(s) in {time.time() - started:.1f}s")
+            if not args.watch:
+                break
+            time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
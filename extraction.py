@@ -0,0 +1,173 @@
+"""
+Text, page count and thumbnail extraction for uploaded lesson documents
+
+Everything here is database-free and works on plain file paths so it can
+run in a ProcessPoolExecutor (see extract_documents.py) as well as in the
+web process. Optional tools are used when present:
+
+- PyMuPDF (fitz): PDF text, page count and first-page thumbnail
+- pypdf: PDF text and page count
+- pdftoppm (poppler-utils): PDF thumbnail when PyMuPDF is missing
+
+DOCX/PPTX are read with zipfile (they are zipped XML) and reuse the
+thumbnail Office embeds in docProps/. Legacy .doc/.ppt are not supported.
+"""
+import os
+import re
+import html
+import shutil
+import zipfile
+import subprocess
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
+
+# Enough for search and previews without bloating the lesson row
+MAX_TEXT_CHARS = 200000
+THUMBNAIL_WIDTH = 320
+
+SUPPORTED_EXTENSIONS = {'pdf', 'docx', 'pptx', 'txt', 'rtf'}
+
+
+def normalize_text(raw):
+    text = re.sub(r'[ \t\r\f\v]+', ' ', raw or '')
+    text = re.sub(r'\n\s*\n+', '\n\n', text)
+    return text.strip()[:MAX_TEXT_CHARS]
+
+
+def extract(path, thumbnail_path=None):
+    """Extract a document; returns a dict suitable for apply_extraction_result()."""
+    result = {'status': 'done', 'text': '', 'page_count': None, 'thumbnail': None, 'error': None}
+
+    ext = path.rsplit('.', 1)[-1].lower() if '.' in path else ''
+    if ext not in SUPPORTED_EXTENSIONS:
+        result['status'] = 'unsupported'
+        return result
+    if not os.path.exists(path):
+        result.update(status='failed', error='File not found')
+        return result
+
+    try:
+        if ext == 'pdf':
+            text, pages, thumbnail = extract_pdf(path, thumbnail_path)
+        elif ext in ('docx', 'pptx'):
+            text, pages, thumbnail = extract_office(path, ext, thumbnail_path)
+        elif ext == 'rtf':
+            text, pages, thumbnail = extract_rtf(path), None, None
+        else:
+            with open(path, encoding='utf-8', errors='replace') as f:
+                text, pages, thumbnail = f.read(MAX_TEXT_CHARS), None, None
+    except Exception as e:
+        result.update(status='failed', error=f"{type(e).__name__}: {e}"[:500])
+        return result
+
+    result.update(text=normalize_text(text), page_count=pages, thumbnail=thumbnail)
+    return result
+
+
+# ============ PDF ============
+def extract_pdf(path, thumbnail_path):
+    if fitz is not None:
+        with fitz.open(path) as doc:
+            parts = []
+            size = 0
+            for page in doc:
+                page_text = page.get_text()
+                parts.append(page_text)
+                size += len(page_text)
+                if size >= MAX_TEXT_CHARS:
+                    break
+            thumbnail = None
+            if thumbnail_path and doc.page_count:
+                first = doc[0]
+                zoom = THUMBNAIL_WIDTH / max(first.rect.width, 1)
+                first.get_pixmap(matrix=fitz.Matrix(zoom, zoom)).save(thumbnail_path)
+                thumbnail = thumbnail_path
+            return '\n\n'.join(parts), doc.page_count, thumbnail
+
+    text, pages = '', None
+    if pypdf is not None:
+        reader = pypdf.PdfReader(path)
+        pages = len(reader.pages)
+        parts = []
+        size = 0
+        for page in reader.pages:
+            page_text = page.extract_text() or ''
+            parts.append(page_text)
+            size += len(page_text)
+            if size >= MAX_TEXT_CHARS:
+                break
+        text = '\n\n'.join(parts)
+
+    return text, pages, render_pdf_thumbnail(path, thumbnail_path)
+
+
+def render_pdf_thumbnail(path, thumbnail_path):
+    if not thumbnail_path or not shutil.which('pdftoppm'):
+        return None
+    stem = thumbnail_path[:-len('.png')] if thumbnail_path.endswith('.png') else thumbnail_path
+    subprocess.run(
+        ['pdftoppm', '-png', '-f', '1', '-l', '1', '-singlefile', '-scale-to', str(THUMBNAIL_WIDTH), path, stem],
+        check=True, timeout=60, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    return stem + '.png' if os.path.exists(stem + '.png') else None
+
+
+# ============ OFFICE (OOXML) ============
+def _xml_text(xml, text_tag, paragraph_tag):
+    paragraphs = []
+    for chunk in xml.split(f'</{paragraph_tag}>'):
+        runs = re.findall(rf'<{text_tag}(?:\s[^>]*)?>([^<]*)</{text_tag}>', chunk)
+        if runs:
+            paragraphs.append(''.join(runs))
+    return html.unescape('\n'.join(paragraphs))
+
+
+def extract_office(path, ext, thumbnail_path):
+    with zipfile.ZipFile(path) as archive:
+        names = archive.namelist()
+
+        if ext == 'docx':
+            xml = archive.read('word/document.xml').decode('utf-8', errors='replace')
+            text = _xml_text(xml, 'w:t', 'w:p')
+            pages = None
+            if 'docProps/app.xml' in names:
+                match = re.search(r'<Pages>(\d+)</Pages>', archive.read('docProps/app.xml').decode('utf-8', 'replace'))
+                pages = int(match.group(1)) if match else None
+        else:
+            slides = sorted(
+                (n for n in names if re.match(r'ppt/slides/slide\d+\.xml$', n)),
+                key=lambda n: int(re.search(r'(\d+)\.xml$', n).group(1)),
+            )
+            text = '\n\n'.join(
+                _xml_text(archive.read(n).decode('utf-8', errors='replace'), 'a:t', 'a:p') for n in slides
+            )
+            pages = len(slides)
+
+        thumbnail = None
+        embedded = next((n for n in names if n.lower().startswith('docprops/thumbnail.')), None)
+        if thumbnail_path and embedded:
+            thumbnail = os.path.splitext(thumbnail_path)[0] + os.path.splitext(embedded)[1].lower()
+            with open(thumbnail, 'wb') as f:
+                f.write(archive.read(embedded))
+
+    return text, pages, thumbnail
+
+
+# ============ RTF ============
+def extract_rtf(path):
+    with open(path, encoding='latin-1') as f:
+        raw = f.read(MAX_TEXT_CHARS * 2)
+    # Header groups (fonts, colours, styles, metadata) are not document text
+    raw = re.sub(r'\{(?:\\\*)?\\(?:fonttbl|colortbl|stylesheet|info)(?:[^{}]|\{[^{}]*\})*\}', '', raw)
+    raw = re.sub(r'\\par[d]?\b', '\n', raw)
+    raw = re.sub(r"\\'[0-9a-f]{2}", '', raw)
+    raw = re.sub(r'\\[a-z]+-?\d* ?', '', raw)
+    return re.sub(r'[{}]', '', raw)
@@ -0,0 +1,104 @@
+"""
+Gunicorn configuration, loaded automatically from the project directory
+
+GUNICORN_WORKER_CLASS picks the concurrency model:
+
+- gthread (default): every worker process serves GUNICORN_THREADS requests
+  at once, so a slow download or a stalled query ties up one thread, not
+  the whole process
+- gevent: every worker serves up to GUNICORN_WORKER_CONNECTIONS requests
+  as greenlets; sockets, the DB driver (via psycogreen) and outbound HTTP
+  yield while they wait. Best for many slow mobile clients; CPU-heavy work
+  (document extraction) should then run in extract_documents.py instead
+- sync: one request per process, the old behaviour
+
+Workers default to 2 x CPUs + 1, capped by the memory available to the
+container divided by WORKER_MEMORY_MB; WEB_CONCURRENCY overrides both.
+The chosen numbers are exported for db_pool, which sizes each worker's
+connection pool to match.
+
+bench_workers.py compares the three models.
+"""
+import os
+import sys
+import multiprocessing
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+
+
+def available_memory_mb():
+    """Memory limit of this container (cgroup v2/v1) or, failing that, MemAvailable."""
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+            if value != 'max' and int(value) < 1 << 60:
+                return int(value) // (1024 * 1024)
+        except (OSError, ValueError):
+            pass
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) // 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def default_workers():
+    workers = 2 * multiprocessing.cpu_count() + 1
+    memory = available_memory_mb()
+    if memory:
+        workers = min(workers, memory // int(os.environ.get('WORKER_MEMORY_MB', 200)))
+    return max(1, workers)
+
+
+workers = int(os.environ.get('WEB_CONCURRENCY') or default_workers())
+# gunicorn silently turns sync workers into gthread ones when threads > 1
+threads = int(os.environ.get('GUNICORN_THREADS') or 4) if worker_class == 'gthread' else 1
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 200))
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+# Templates are compiled once in the master and shared with forked workers (see template_cache.py)
+preload_app = True
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then so slow leaks cannot build up; cheap with preload
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+
+# Request concurrency per worker, read by db_pool when app.py is imported
+os.environ['WEB_CONCURRENCY'] = str(workers)
+os.environ['GUNICORN_THREADS'] = str(
+    min(worker_connections, int(os.environ.get('DB_POOL_SIZE', 10))) if worker_class == 'gevent' else threads
+)
+
+if worker_class == 'gevent':
+    # Patch before app.py is preloaded, so every socket, lock and thread it creates is cooperative
+    from gevent import monkey
+    monkey.patch_all()
+    try:
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+    except ImportError:
+        print("⚠️ psycogreen not installed: Postgres queries will block other greenlets")
+    os.environ.setdefault('DOCUMENT_EXTRACTION_IN_PROCESS', '0')
+
+
+def when_ready(server):
+    server.log.info(f"{worker_class} workers: {workers}"
+                    + (f" x {threads} threads" if worker_class == 'gthread' else '')
+                    + (f" x {worker_connections} connections" if worker_class == 'gevent' else ''))
+
+
+def post_worker_init(worker):
+    # Open this worker's DB connections before it accepts requests (the
+    # preloaded master already warmed templates and the catalog)
+    app_module = sys.modules.get('app')
+    if os.environ.get('WARM_UP_ON_START', '1') == '1' and hasattr(app_module, 'warm_connections'):
+        try:
+            app_module.warm_connections()
+        except Exception as e:
+            worker.log.warning(f"Connection warm-up failed: {e}")
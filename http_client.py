@@ -0,0 +1,62 @@
+"""
+Shared outbound HTTP client
+
+One requests.Session per process, so calls to payment providers, SMS
+gateways and webhooks reuse kept-alive connections instead of opening a
+TCP+TLS connection each time. The connection pool is sized to the worker's
+request concurrency, and every call gets a timeout, so a stalled provider
+cannot hold a request thread (or greenlet) forever. Under the gevent
+worker the sockets are monkey-patched and simply yield while waiting.
+
+requests.Session is safe to share between threads for plain requests; do
+not change its headers or cookies per call, pass them as arguments.
+"""
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_TIMEOUT = (5, 30)  # connect, read seconds
+
+_session = None
+_lock = threading.Lock()
+
+
+class TimeoutSession(requests.Session):
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+        return super().request(method, url, **kwargs)
+
+
+def _build_session():
+    pool_size = max(10, int(os.environ.get('GUNICORN_THREADS', 1)))
+    # Retry connection failures and 502/503/504 for idempotent methods only
+    retries = Retry(total=2, backoff_factor=0.3, status_forcelist=(502, 503, 504),
+                    allowed_methods=frozenset({'GET', 'HEAD', 'OPTIONS'}))
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=pool_size, max_retries=retries)
+
+    session = TimeoutSession()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def http():
+    """The process-wide outbound session, created on first use (after any fork)."""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def _reset_after_fork():
+    # Connections opened by the preloading master must not be shared with workers
+    global _session
+    _session = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
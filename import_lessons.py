@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Bulk-import lessons from a curriculum manifest (format: see lesson_import.py)
+
+    python import_lessons.py term2.csv --media term2_media/ --dry-run
+    python import_lessons.py term2.yaml --media term2_media.zip
+    python import_lessons.py term2.json --media media/ --batch-size 200 --workers 8
+
+Lessons are matched on subject, week, day and order: existing ones are
+updated, missing ones created, and unchanged ones left alone.
+"""
+import sys
+import argparse
+
+
+def print_report(report, dry_run):
+    for row_no, message in report['errors']:
+        print(f"❌ row {row_no}: {message}")
+    if report['errors']:
+        print(f"Nothing imported: {len(report['errors'])} invalid row(s)")
+        return
+
+    symbols = {'create': '+', 'update': '~', 'unchanged': '='}
+    for item in report['plan']:
+        if item['action'] == 'unchanged':
+            continue
+        where = f"{item['subject']} W{item['week']} D{item['day']} #{item['order']}"
+        print(f"{symbols[item['action']]} {where}: {item['title']}")
+        if item['action'] == 'update':
+            for field, (old, new) in item['changes'].items():
+                print(f"    {field}: {old!r} -> {new!r}")
+
+    verb = 'Would create' if dry_run else 'Created'
+    print(f"{'🔎' if dry_run else '✅'} {verb} {report['created']}, "
+          f"{'update' if dry_run else 'updated'} {report['updated']}, unchanged {report['unchanged']}")
+    if not dry_run and report['documents']:
+        print(f"📄 {report['documents']} document(s) queued; run extract_documents.py to index them")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import lessons from a CSV/JSON/YAML manifest')
+    parser.add_argument('manifest', help='manifest file (.csv, .json, .yaml)')
+    parser.add_argument('--media', help='directory or .zip holding the files named in the manifest')
+    parser.add_argument('--dry-run', action='store_true', help='show what would change without writing')
+    parser.add_argument('--batch-size', type=int, default=100, help='lessons per transaction')
+    parser.add_argument('--workers', type=int, default=4, help='parallel media hashing/copying threads')
+    args = parser.parse_args()
+
+    import lesson_import
+    from app import app, import_lessons
+
+    try:
+        with open(args.manifest, 'rb') as f:
+            rows = lesson_import.load_manifest(f, args.manifest)
+        media = lesson_import.open_media(args.media) if args.media else None
+    except (OSError, lesson_import.ManifestError) as e:
+        print(f"❌ {e}")
+        return 1
+
+    try:
+        with app.app_context():
+            report = import_lessons(rows, media, dry_run=args.dry_run,
+                                    batch_size=args.batch_size, workers=args.workers)
+    except lesson_import.ManifestError as e:
+        print(f"❌ {e}")
+        return 1
+    finally:
+        if media:
+            media.close()
+
+    print_report(report, args.dry_run)
+    return 1 if report['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
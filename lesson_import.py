@@ -0,0 +1,167 @@
+"""
+Curriculum manifest reading for bulk lesson import
+
+A manifest lists one lesson per row/item with these fields (only subject,
+title, week and day are required):
+
+    subject, title, description, week, day, order, duration,
+    content_type, youtube_url, file, published
+
+`subject` is a subject code or name and `file` names a media file inside
+the directory or zip given alongside the manifest. CSV needs a header
+row; JSON and YAML take a list of objects or {"lessons": [...]}.
+
+Validation against the database and the actual import live in app.py
+(import_lessons); this module only reads manifests and media sources and
+hashes/stages media files in parallel.
+"""
+import io
+import os
+import csv
+import json
+import hashlib
+import zipfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import media_storage
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+MANIFEST_FORMATS = ('csv', 'json', 'yaml', 'yml')
+
+
+class ManifestError(ValueError):
+    pass
+
+
+def load_manifest(stream, filename):
+    """Parse a manifest file into a list of row dicts with lower-case keys."""
+    fmt = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    raw = stream.read()
+    if isinstance(raw, bytes):
+        raw = raw.decode('utf-8-sig')
+
+    if fmt == 'csv':
+        rows = list(csv.DictReader(io.StringIO(raw)))
+    elif fmt == 'json':
+        try:
+            rows = json.loads(raw)
+        except ValueError as e:
+            raise ManifestError(f"Invalid JSON: {e}")
+    elif fmt in ('yaml', 'yml'):
+        if yaml is None:
+            raise ManifestError('YAML manifests need PyYAML (pip install PyYAML)')
+        try:
+            rows = yaml.safe_load(raw)
+        except yaml.YAMLError as e:
+            raise ManifestError(f"Invalid YAML: {e}")
+    else:
+        raise ManifestError(f"Unsupported manifest format '{fmt}' (use {', '.join(MANIFEST_FORMATS)})")
+
+    if isinstance(rows, dict):
+        rows = rows.get('lessons')
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        raise ManifestError('Manifest must be a list of lessons')
+
+    return [{str(k).strip().lower(): (v.strip() if isinstance(v, str) else v) for k, v in row.items() if k}
+            for row in rows]
+
+
+# ============ MEDIA SOURCES ============
+class DirectoryMedia:
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def exists(self, name):
+        path = self._path(name)
+        return path is not None and os.path.isfile(path)
+
+    def open(self, name):
+        return open(self._path(name), 'rb')
+
+    def _path(self, name):
+        path = os.path.abspath(os.path.join(self.root, name))
+        # Manifest names must not climb out of the media directory
+        return path if path.startswith(self.root + os.sep) else None
+
+    def close(self):
+        pass
+
+
+class ZipMedia:
+    def __init__(self, path):
+        self.path = path
+        self.archives = []
+        # One ZipFile per worker thread so members decompress in parallel
+        self.local = threading.local()
+        self.members = {info.filename for info in self._archive().infolist() if not info.is_dir()}
+
+    def _archive(self):
+        if not hasattr(self.local, 'archive'):
+            self.local.archive = zipfile.ZipFile(self.path)
+            self.archives.append(self.local.archive)
+        return self.local.archive
+
+    def exists(self, name):
+        return name in self.members
+
+    def open(self, name):
+        return self._archive().open(name)
+
+    def close(self):
+        for archive in self.archives:
+            archive.close()
+
+
+def open_media(path):
+    """Media source for a directory or a .zip file."""
+    if os.path.isdir(path):
+        return DirectoryMedia(path)
+    if zipfile.is_zipfile(path):
+        return ZipMedia(path)
+    raise ManifestError(f"Media source {path} is neither a directory nor a zip file")
+
+
+def _hash(media, name):
+    with media.open(name) as f:
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: f.read(media_storage.CHUNK_SIZE), b''):
+            digest.update(chunk)
+        return digest.hexdigest()
+
+
+def _stage(media, name, store, keep):
+    with media.open(name) as f:
+        return (store.stage if keep else store.checksum)(f, os.path.basename(name))
+
+
+def prepare_media(media, names, workers=4, store=None, keep=True):
+    """Hash (dry run) or stage into `store` every named file in parallel.
+
+    Returns {name: StoredBlob} when staging, otherwise {name: checksum}.
+    With keep=False the store only computes the checksums it would give
+    the files (after its preparers), so a dry run matches the real import.
+    Hashing and file copies release the GIL, so threads overlap the I/O.
+    """
+    names = sorted(set(names))
+    job = (lambda name: _stage(media, name, store, keep)) if store else (lambda name: _hash(media, name))
+
+    results, failures = {}, []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(job, name): name for name in names}
+        for future in as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                failures.append(f"{futures[future]}: {e}")
+
+    if failures:
+        if store and keep:
+            for blob in results.values():
+                store.discard(blob)
+        raise ManifestError('Could not read media files: ' + '; '.join(failures[:5]))
+    return results
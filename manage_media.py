@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Maintain the content-addressed media store
+
+    python manage_media.py import-legacy   # move old timestamp-named uploads into the store
+    python manage_media.py gc              # delete blobs unreferenced for MEDIA_GC_GRACE_HOURS
+    python manage_media.py gc --dry-run    # only report what would be deleted
+    python manage_media.py stats
+"""
+import sys
+import argparse
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintain the lesson media store')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('import-legacy', help='hash and deduplicate uploads made before the media store')
+    gc_parser = commands.add_parser('gc', help='garbage-collect unreferenced blobs')
+    gc_parser.add_argument('--dry-run', action='store_true', help='report without deleting anything')
+    commands.add_parser('stats', help='show storage and deduplication totals')
+    args = parser.parse_args()
+
+    from app import app, db, MediaAsset, collect_media_garbage, import_legacy_uploads
+
+    with app.app_context():
+        if args.command == 'import-legacy':
+            imported = import_legacy_uploads(verbose=True)
+            print(f"✅ {imported} lesson file(s) moved into the media store")
+
+        elif args.command == 'gc':
+            report = collect_media_garbage(dry_run=args.dry_run)
+            prefix = 'Would delete' if args.dry_run else 'Deleted'
+            print(f"🧹 {prefix} {report['deleted_assets']} asset(s) and {report['deleted_orphans']} orphaned blob(s), "
+                  f"{report['bytes_freed'] / 1024 / 1024:.1f} MB")
+            if report['reconciled']:
+                print(f"🔧 Corrected {report['reconciled']} reference count(s)")
+
+        else:
+            assets, stored, referenced = db.session.query(
+                db.func.count(MediaAsset.id),
+                db.func.coalesce(db.func.sum(MediaAsset.size), 0),
+                db.func.coalesce(db.func.sum(MediaAsset.size * MediaAsset.ref_count), 0),
+            ).one()
+            print(f"📦 {assets} asset(s), {stored / 1024 / 1024:.1f} MB stored")
+            print(f"♻️ {max(referenced - stored, 0) / 1024 / 1024:.1f} MB saved by deduplication")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
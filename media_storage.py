@@ -0,0 +1,363 @@
+"""
+Content-addressed blob storage for lesson media
+
+Uploads are stored once under the SHA-256 of their bytes
+(`<sha256>.<ext>`), so the same video uploaded for several subjects or
+re-uploaded after an edit takes no extra space, and a blob's URL never
+changes content, which makes it safe to cache forever.
+
+This module only deals with files; the MediaAsset table in app.py keeps
+checksums, sizes, mime types and reference counts. Two backends share one
+interface, picked by MEDIA_STORAGE (see create_store):
+
+- local: blobs sit in UPLOAD_FOLDER on the web node's disk
+- s3: blobs live in an S3-compatible bucket (AWS, MinIO, R2, Spaces...);
+  students download them through short-lived presigned URLs and the web
+  node keeps a local copy only when it has to process a file itself, in a
+  cache bounded by MEDIA_LOCAL_CACHE_MB (least recently used copies go first)
+"""
+import os
+import re
+import shutil
+import hashlib
+import tempfile
+import mimetypes
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
+
+CHUNK_SIZE = 1024 * 1024
+
+# Blob names are the only files the garbage collector may delete
+BLOB_NAME = re.compile(r'^[0-9a-f]{64}(\.[a-z0-9]+)?$')
+
+MISSING_CODES = ('404', 'NoSuchKey', 'NotFound')
+
+
+class RangeNotSatisfiable(ValueError):
+    """A `bytes=` range that starts past the end of the blob."""
+
+
+class StoredBlob:
+    """Result of writing an upload into the store."""
+
+    def __init__(self, checksum, size, extension, temp_path):
+        self.checksum = checksum
+        self.size = size
+        self.extension = extension
+        self.temp_path = temp_path
+
+    @property
+    def name(self):
+        return f"{self.checksum}.{self.extension}" if self.extension else self.checksum
+
+    @property
+    def mime_type(self):
+        return mimetypes.guess_type(self.name)[0] or 'application/octet-stream'
+
+
+class BlobStore:
+    """Shared upload staging: every backend hashes the upload on local disk first."""
+
+    # True when blobs are not on this node's disk and can be presigned
+    remote = False
+
+    def __init__(self, root, preparers=None):
+        self.root = root
+        # {extension: fn(path)} rewriting a staged file in place, returning True if it changed it
+        self.preparers = preparers or {}
+
+    def stage(self, stream, filename):
+        """Copy a stream to a temp file in chunks while hashing it.
+
+        Nothing is visible under a blob name until commit(), so a failed
+        upload never leaves a half-written blob behind. A preparer for the
+        extension (e.g. PDF linearization) runs on the temp file first, so
+        the checksum names the bytes that are stored and committed blobs
+        are never rewritten.
+        """
+        extension = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+        digest = hashlib.sha256()
+        size = 0
+
+        os.makedirs(self.root, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix='.upload-', dir=self.root)
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    size += len(chunk)
+                    out.write(chunk)
+            prepare = self.preparers.get(extension)
+            if prepare and prepare(temp_path):
+                return StoredBlob(file_checksum(temp_path), os.path.getsize(temp_path), extension, temp_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return StoredBlob(digest.hexdigest(), size, extension, temp_path)
+
+    def checksum(self, stream, filename):
+        """The checksum stage() would give a stream, without keeping a copy."""
+        extension = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+        if extension in self.preparers:
+            blob = self.stage(stream, filename)
+            self.discard(blob)
+            return blob.checksum
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+        return digest.hexdigest()
+
+    def discard(self, blob):
+        if os.path.exists(blob.temp_path):
+            os.remove(blob.temp_path)
+
+    def presigned_url(self, name, expires, content_type=None, download_name=None):
+        return None
+
+
+class LocalBlobStore(BlobStore):
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def local_path(self, name):
+        return self.path(name)
+
+    def exists(self, name):
+        return os.path.exists(self.path(name))
+
+    def commit(self, blob, name=None):
+        """Move a staged upload to its blob name, or drop it if that blob already exists."""
+        target = self.path(name or blob.name)
+        if os.path.exists(target):
+            os.remove(blob.temp_path)
+        else:
+            os.replace(blob.temp_path, target)
+        return name or blob.name
+
+    def put_file(self, path, name):
+        if not self.exists(name):
+            shutil.copy2(path, self.path(name))
+
+    def delete(self, name):
+        if BLOB_NAME.match(name) and self.exists(name):
+            os.remove(self.path(name))
+            return True
+        return False
+
+    def blob_names(self):
+        return [name for name in os.listdir(self.root) if BLOB_NAME.match(name)]
+
+    def blob_mtime(self, name):
+        return os.path.getmtime(self.path(name))
+
+    def blob_size(self, name):
+        return os.path.getsize(self.path(name))
+
+
+class S3BlobStore(BlobStore):
+    """Blobs in an S3-compatible bucket; `root` holds staging files and local copies."""
+
+    remote = True
+
+    def __init__(self, root, bucket, prefix='', endpoint_url=None, region=None,
+                 access_key=None, secret_key=None, preparers=None, cache_bytes=2 * 1024 ** 3):
+        if boto3 is None:
+            raise RuntimeError('MEDIA_STORAGE=s3 needs boto3 (pip install boto3)')
+        super().__init__(root, preparers)
+        self.cache_bytes = cache_bytes
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        # endpoint_url points the client at MinIO or another S3-compatible server
+        self.client = boto3.client(
+            's3', endpoint_url=endpoint_url or None, region_name=region or None,
+            aws_access_key_id=access_key or None, aws_secret_access_key=secret_key or None,
+        )
+
+    def key(self, name):
+        return self.prefix + name
+
+    def exists(self, name):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.key(name))
+            return True
+        except ClientError as e:
+            if _error_code(e) in MISSING_CODES:
+                return False
+            raise
+
+    def put_file(self, path, name):
+        """Upload from disk; boto3 switches to multipart for large files, so nothing is held in memory."""
+        if self.exists(name):
+            return
+        self.client.upload_file(path, self.bucket, self.key(name), ExtraArgs={
+            'ContentType': mimetypes.guess_type(name)[0] or 'application/octet-stream',
+            'CacheControl': 'private, max-age=31536000, immutable',
+        })
+
+    def commit(self, blob, name=None):
+        name = name or blob.name
+        try:
+            self.put_file(blob.temp_path, name)
+        finally:
+            self.discard(blob)
+        return name
+
+    def local_path(self, name):
+        """Local copy of a blob for extraction and page rendering, downloaded on first use.
+
+        Like LocalBlobStore, the path of a blob that does not exist is
+        returned as is, so callers check os.path.exists() either way.
+        """
+        path = os.path.join(self.root, name)
+        if not BLOB_NAME.match(name):
+            return path
+        if os.path.exists(path):
+            # Marks the copy as recently used for eviction
+            os.utime(path)
+            return path
+
+        os.makedirs(self.root, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix='.download-', dir=self.root)
+        os.close(fd)
+        try:
+            self.client.download_file(self.bucket, self.key(name), temp_path)
+            os.replace(temp_path, path)
+        except ClientError as e:
+            if _error_code(e) not in MISSING_CODES:
+                raise
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        if os.path.exists(path):
+            self.evict_local_copies(keep=name)
+        return path
+
+    def evict_local_copies(self, keep=None):
+        """Delete the least recently used local copies until they fit in cache_bytes.
+
+        A copy removed while another request reads it stays readable to
+        that reader (POSIX unlink semantics) and is fetched again next time.
+        """
+        copies, total = [], 0
+        for entry in os.scandir(self.root):
+            if not BLOB_NAME.match(entry.name):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            total += stat.st_size
+            if entry.name != keep:
+                copies.append((stat.st_mtime, stat.st_size, entry.path))
+
+        evicted = 0
+        for _, size, path in sorted(copies):
+            if total <= self.cache_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+        return evicted
+
+    def open_stream(self, name, byte_range=None):
+        """Stream a blob (optionally a `bytes=` range) through the app; returns (chunks, headers).
+
+        Raises FileNotFoundError if the blob is not in the bucket and
+        RangeNotSatisfiable if the range starts past its end.
+        """
+        params = {'Bucket': self.bucket, 'Key': self.key(name)}
+        if byte_range:
+            params['Range'] = byte_range
+        try:
+            obj = self.client.get_object(**params)
+        except ClientError as e:
+            code = _error_code(e)
+            if code in MISSING_CODES:
+                raise FileNotFoundError(name) from e
+            if code == 'InvalidRange':
+                raise RangeNotSatisfiable(byte_range) from e
+            raise
+        headers = {
+            'Content-Type': obj.get('ContentType') or 'application/octet-stream',
+            'Content-Length': str(obj['ContentLength']),
+            'Accept-Ranges': 'bytes',
+        }
+        if obj.get('ContentRange'):
+            headers['Content-Range'] = obj['ContentRange']
+        return obj['Body'].iter_chunks(CHUNK_SIZE), headers
+
+    def presigned_url(self, name, expires, content_type=None, download_name=None):
+        params = {'Bucket': self.bucket, 'Key': self.key(name)}
+        if content_type:
+            params['ResponseContentType'] = content_type
+        if download_name:
+            params['ResponseContentDisposition'] = f'inline; filename="{download_name}"'
+        return self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=expires)
+
+    def delete(self, name):
+        if not BLOB_NAME.match(name):
+            return False
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(name))
+        local = os.path.join(self.root, name)
+        if os.path.exists(local):
+            os.remove(local)
+        return True
+
+    def _objects(self):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for obj in page.get('Contents', []):
+                name = obj['Key'][len(self.prefix):]
+                if BLOB_NAME.match(name):
+                    yield name, obj
+
+    def blob_names(self):
+        return [name for name, _ in self._objects()]
+
+    def blob_mtime(self, name):
+        return self.client.head_object(Bucket=self.bucket, Key=self.key(name))['LastModified'].timestamp()
+
+    def blob_size(self, name):
+        return self.client.head_object(Bucket=self.bucket, Key=self.key(name))['ContentLength']
+
+
+def create_store(config, preparers=None):
+    """Build the blob store selected by MEDIA_STORAGE ('local' or 's3')."""
+    backend = config.get('MEDIA_STORAGE', 'local')
+    if backend == 'local':
+        return LocalBlobStore(config['UPLOAD_FOLDER'], preparers)
+    if backend == 's3':
+        return S3BlobStore(
+            config['UPLOAD_FOLDER'],
+            bucket=config['MEDIA_S3_BUCKET'],
+            prefix=config.get('MEDIA_S3_PREFIX', ''),
+            endpoint_url=config.get('MEDIA_S3_ENDPOINT_URL'),
+            region=config.get('MEDIA_S3_REGION'),
+            access_key=config.get('MEDIA_S3_ACCESS_KEY'),
+            secret_key=config.get('MEDIA_S3_SECRET_KEY'),
+            preparers=preparers,
+            cache_bytes=int(config.get('MEDIA_LOCAL_CACHE_MB', 2048)) * 1024 * 1024,
+        )
+    raise ValueError(f"Unknown MEDIA_STORAGE backend: {backend}")
+
+
+def _error_code(error):
+    return error.response.get('Error', {}).get('Code')
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,202 @@
+"""
+Notification channels for the outbox dispatcher
+
+The web app only inserts Notification rows (in the same transaction as
+the change they announce); send_notifications.py claims due rows in
+batches and hands each channel its share. A channel gets plain message
+dicts (id, recipient, subject, body) and returns {id: error or None}, so
+one bad number does not fail the rest of the batch. Failed messages are
+retried later with exponential backoff (see retry_delay).
+
+Channels are picked per kind by NOTIFY_EMAIL_BACKEND / NOTIFY_SMS_BACKEND:
+
+- console: print the message (the default, for local runs)
+- file: append it as a JSON line to NOTIFY_FILE_DIR/<kind>.ndjson
+- smtp (email): one SMTP connection per batch (SMTP_HOST, SMTP_PORT,
+  SMTP_USER, SMTP_PASSWORD, SMTP_FROM, SMTP_STARTTLS)
+- http (sms): POST {"to", "message"} to SMS_GATEWAY_URL with
+  SMS_GATEWAY_TOKEN as a bearer token, through the shared HTTP client
+- off: do not queue this kind at all
+
+NOTIFY_<KIND>_RATE caps messages per second per channel, to stay inside
+the provider's limits. The cap holds for one dispatcher process; run a
+single send_notifications.py per deployment.
+"""
+import os
+import json
+import time
+import random
+import smtplib
+import threading
+from email.message import EmailMessage
+
+import http_client
+
+
+def retry_delay(attempts, base=30, cap=6 * 3600):
+    """Seconds before retry number `attempts` (1, 2, ...): 30s, 1m, 2m, ... up to 6h, with jitter."""
+    delay = min(cap, base * 2 ** max(attempts - 1, 0))
+    return delay * random.uniform(0.8, 1.2)
+
+
+class Throttle:
+    """At most `rate` calls to wait() per second (no limit when rate is falsy)."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Channel:
+    backend = None
+
+    def __init__(self, kind, rate=None):
+        self.kind = kind
+        self.throttle = Throttle(rate)
+
+    def open(self):
+        """Connection (or None) shared by one batch."""
+        return None
+
+    def close(self, connection):
+        pass
+
+    def send(self, connection, message):
+        raise NotImplementedError
+
+    def send_batch(self, messages):
+        results = {}
+        try:
+            connection = self.open()
+        except Exception as e:
+            return {message['id']: f"{type(e).__name__}: {e}" for message in messages}
+        try:
+            for message in messages:
+                self.throttle.wait()
+                try:
+                    self.send(connection, message)
+                    results[message['id']] = None
+                except Exception as e:
+                    results[message['id']] = f"{type(e).__name__}: {e}"
+        finally:
+            try:
+                self.close(connection)
+            except Exception:
+                pass
+        return results
+
+
+class ConsoleChannel(Channel):
+    backend = 'console'
+
+    def send(self, connection, message):
+        print(f"📨 [{self.kind}] to {message['recipient']}: {message['subject'] or ''}\n{message['body']}\n")
+
+
+class FileChannel(Channel):
+    backend = 'file'
+
+    def __init__(self, kind, rate=None, directory='notifications'):
+        super().__init__(kind, rate)
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{kind}.ndjson")
+
+    def open(self):
+        return open(self.path, 'a', encoding='utf-8')
+
+    def close(self, connection):
+        connection.close()
+
+    def send(self, connection, message):
+        connection.write(json.dumps({**message, 'sent_at': time.time()}) + '\n')
+
+
+class SmtpChannel(Channel):
+    backend = 'smtp'
+
+    def __init__(self, kind, rate=None, host='localhost', port=587, user=None, password=None,
+                 sender='no-reply@threefoldventures.com', starttls=True):
+        super().__init__(kind, rate)
+        self.host, self.port, self.user, self.password = host, port, user, password
+        self.sender, self.starttls = sender, starttls
+
+    def open(self):
+        connection = smtplib.SMTP(self.host, self.port, timeout=30)
+        if self.starttls:
+            connection.starttls()
+        if self.user:
+            connection.login(self.user, self.password)
+        return connection
+
+    def close(self, connection):
+        connection.quit()
+
+    def send(self, connection, message):
+        email = EmailMessage()
+        email['From'] = self.sender
+        email['To'] = message['recipient']
+        email['Subject'] = message['subject'] or 'THREE FOLD VENTURES'
+        email.set_content(message['body'])
+        connection.send_message(email)
+
+
+class HttpSmsChannel(Channel):
+    backend = 'http'
+
+    def __init__(self, kind, rate=None, url=None, token=None):
+        super().__init__(kind, rate)
+        if not url:
+            raise ValueError('SMS_GATEWAY_URL is required for NOTIFY_SMS_BACKEND=http')
+        self.url, self.token = url, token
+
+    def send(self, connection, message):
+        headers = {'Authorization': f"Bearer {self.token}"} if self.token else {}
+        response = http_client.http().post(self.url, json={'to': message['recipient'], 'message': message['body']},
+                                           headers=headers)
+        response.raise_for_status()
+
+
+def create_channels(config):
+    """Enabled channels by kind ('email', 'sms') from app config / environment."""
+    directory = config.get('NOTIFY_FILE_DIR', 'notifications')
+    channels = {}
+
+    backend = config.get('NOTIFY_EMAIL_BACKEND', 'console')
+    rate = config.get('NOTIFY_EMAIL_RATE')
+    if backend == 'smtp':
+        channels['email'] = SmtpChannel(
+            'email', rate,
+            host=os.environ.get('SMTP_HOST', 'localhost'),
+            port=int(os.environ.get('SMTP_PORT', 587)),
+            user=os.environ.get('SMTP_USER'),
+            password=os.environ.get('SMTP_PASSWORD'),
+            sender=os.environ.get('SMTP_FROM', 'no-reply@threefoldventures.com'),
+            starttls=os.environ.get('SMTP_STARTTLS', '1') == '1',
+        )
+    elif backend == 'file':
+        channels['email'] = FileChannel('email', rate, directory)
+    elif backend == 'console':
+        channels['email'] = ConsoleChannel('email', rate)
+
+    backend = config.get('NOTIFY_SMS_BACKEND', 'console')
+    rate = config.get('NOTIFY_SMS_RATE')
+    if backend == 'http':
+        channels['sms'] = HttpSmsChannel('sms', rate, url=os.environ.get('SMS_GATEWAY_URL'),
+                                         token=os.environ.get('SMS_GATEWAY_TOKEN'))
+    elif backend == 'file':
+        channels['sms'] = FileChannel('sms', rate, directory)
+    elif backend == 'console':
+        channels['sms'] = ConsoleChannel('sms', rate)
+
+    return channels
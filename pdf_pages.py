@@ -0,0 +1,161 @@
+"""
+Paged PDF delivery
+
+Renders single PDF pages to compressed JPEGs on demand and keeps them in a
+disk cache, so a phone only downloads the pages a student actually opens
+instead of the whole file. Also linearizes ("fast web view") uploaded PDFs
+so browsers that do open the original can show page one early.
+
+Rendering uses PyMuPDF when installed, otherwise poppler's pdftoppm.
+Linearization needs the qpdf binary. Every tool is optional: without one
+the caller falls back to serving the original PDF.
+"""
+import os
+import re
+import shutil
+import hashlib
+import tempfile
+import subprocess
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
+
+# Only these widths are rendered so the cache cannot be flooded with sizes
+PAGE_WIDTHS = (480, 800, 1200, 1600)
+DEFAULT_WIDTH = 800
+JPEG_QUALITY = 70
+
+# `<sha256>.pdf`, as named by media_storage
+CONTENT_ADDRESSED = re.compile(r'^([0-9a-f]{64})\.pdf$')
+
+
+def can_render():
+    return fitz is not None or shutil.which('pdftoppm') is not None
+
+
+def snap_width(width):
+    """Round a requested width up to the nearest rendered size."""
+    for candidate in PAGE_WIDTHS:
+        if width <= candidate:
+            return candidate
+    return PAGE_WIDTHS[-1]
+
+
+def page_count(pdf_path):
+    if fitz is not None:
+        with fitz.open(pdf_path) as doc:
+            return doc.page_count
+    if pypdf is not None:
+        return len(pypdf.PdfReader(pdf_path).pages)
+    return None
+
+
+def source_key(pdf_path):
+    """Cache namespace for one version of a file: a replaced upload gets fresh pages.
+
+    Content-addressed blobs never change, so their checksum is the key and
+    their pages can be found (and purged) without the file itself.
+    """
+    match = CONTENT_ADDRESSED.match(os.path.basename(pdf_path))
+    if match:
+        return match.group(1)
+    stat = os.stat(pdf_path)
+    return hashlib.md5(f"{os.path.abspath(pdf_path)}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()
+
+
+def cached_page_path(cache_dir, pdf_path, page, width):
+    return os.path.join(cache_dir, source_key(pdf_path), f"p{page}-w{width}.jpg")
+
+
+def purge_pages(cache_dir, pdf_path):
+    """Remove every cached page of one version of a file."""
+    if CONTENT_ADDRESSED.match(os.path.basename(pdf_path)) or os.path.exists(pdf_path):
+        shutil.rmtree(os.path.join(cache_dir, source_key(pdf_path)), ignore_errors=True)
+
+
+def render_page(pdf_path, page, width, cache_dir):
+    """Return the path of a JPEG of `page` (1-based) at `width` pixels, rendering it if needed.
+
+    Raises ValueError for pages outside the document and RuntimeError when no
+    renderer is installed.
+    """
+    width = snap_width(width)
+    target = cached_page_path(cache_dir, pdf_path, page, width)
+    if os.path.exists(target):
+        return target
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    # Render to a temp file and rename, so concurrent workers never serve half a JPEG
+    fd, tmp_path = tempfile.mkstemp(suffix='.jpg', dir=os.path.dirname(target))
+    os.close(fd)
+    try:
+        if fitz is not None:
+            _render_with_fitz(pdf_path, page, width, tmp_path)
+        elif shutil.which('pdftoppm'):
+            _render_with_pdftoppm(pdf_path, page, width, tmp_path)
+        else:
+            raise RuntimeError('No PDF renderer installed (PyMuPDF or pdftoppm)')
+        os.replace(tmp_path, target)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return target
+
+
+def _render_with_fitz(pdf_path, page, width, out_path):
+    with fitz.open(pdf_path) as doc:
+        if not 1 <= page <= doc.page_count:
+            raise ValueError(f"Page {page} out of range")
+        pdf_page = doc[page - 1]
+        zoom = width / max(pdf_page.rect.width, 1)
+        pixmap = pdf_page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+        with open(out_path, 'wb') as f:
+            f.write(pixmap.tobytes('jpeg', jpg_quality=JPEG_QUALITY))
+
+
+def _render_with_pdftoppm(pdf_path, page, width, out_path):
+    stem = out_path[:-len('.jpg')]
+    result = subprocess.run(
+        ['pdftoppm', '-jpeg', '-jpegopt', f'quality={JPEG_QUALITY}', '-f', str(page), '-l', str(page),
+         '-singlefile', '-scale-to-x', str(width), '-scale-to-y', '-1', pdf_path, stem],
+        timeout=60, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    if result.returncode != 0 or not os.path.exists(stem + '.jpg'):
+        raise ValueError(f"Could not render page {page}: {result.stderr.decode(errors='replace')[:200]}")
+    if stem + '.jpg' != out_path:
+        os.replace(stem + '.jpg', out_path)
+
+
+def linearize(pdf_path):
+    """Rewrite a PDF in place as linearized (fast web view). Returns True if it was changed."""
+    if not shutil.which('qpdf'):
+        return False
+
+    fd, tmp_path = tempfile.mkstemp(suffix='.pdf', dir=os.path.dirname(pdf_path))
+    os.close(fd)
+    try:
+        # --is-linearized exits 0 when the file already is, so re-extraction is cheap
+        if subprocess.run(['qpdf', '--is-linearized', pdf_path], timeout=60,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0:
+            return False
+        # qpdf exits 3 for "succeeded with warnings", which is fine for scans
+        result = subprocess.run(['qpdf', '--linearize', pdf_path, tmp_path],
+                                timeout=300, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if result.returncode not in (0, 3):
+            return False
+        shutil.copymode(pdf_path, tmp_path)
+        os.replace(tmp_path, pdf_path)
+        return True
+    except (OSError, subprocess.SubprocessError):
+        # An unlinearized PDF still works, it just opens more slowly
+        return False
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
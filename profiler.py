@@ -0,0 +1,260 @@
+"""
+On-demand request profiling
+
+An admin adds ?_profile=1 to any URL (or a script sends an X-Profile header
+with a signed token from /admin/profiles) and that single request runs
+under:
+
+- cProfile, for the top functions by cumulative and own time
+- a sampling thread that records the request thread's stack every
+  PROFILE_SAMPLE_INTERVAL seconds, written as collapsed stacks
+  ("frame;frame;frame count" lines) for flamegraph.pl or speedscope.
+  Under the gevent worker the request is a greenlet, so the sampler is a
+  real OS thread that records the worker thread's running frame while the
+  request's greenlet runs, and the greenlet's own frame (where it waits)
+  while it is switched out. cProfile still covers the whole OS thread
+  there, so other greenlets' work can show up in the top functions.
+- SQLAlchemy cursor events, for a timeline of every query it ran
+
+Reports are stored as JSON files in PROFILE_DIR, newest PROFILE_KEEP kept.
+Nothing is attached until a profiled request starts (the SQL listeners are
+removed again when the last one finishes), so ordinary requests only pay
+for the flag lookup in the app's before_request hook.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import pstats
+import cProfile
+import threading
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import event
+
+try:
+    from gevent import monkey as gevent_monkey
+except ImportError:
+    gevent_monkey = None
+
+MAX_STACK_DEPTH = 200
+TOP_FUNCTIONS = 40
+MAX_STATEMENT_LENGTH = 2000
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _gevent_patched():
+    return gevent_monkey is not None and gevent_monkey.is_module_patched('threading')
+
+
+def _short_path(filename):
+    parts = filename.replace('\\', '/').split('/')
+    return '/'.join(parts[-2:])
+
+
+class ProfileSession:
+    """State of one profiled request."""
+
+    def __init__(self, interval):
+        # Keys the session for SQL events; a greenlet id under gevent
+        self.thread_id = threading.get_ident()
+        self.interval = interval
+        self.samples = Counter()
+        self.queries = []
+        self.pending_queries = []
+        self.started = time.perf_counter()
+        self.started_at = datetime.utcnow()
+
+        self.profile = cProfile.Profile()
+        try:
+            self.profile.enable()
+        except ValueError:
+            # Another profiler already owns this thread (e.g. a debugger)
+            self.profile = None
+
+        if _gevent_patched():
+            import greenlet
+            # Patched threads are greenlets that would only run when the request yields
+            self._greenlet = greenlet.getcurrent()
+            self._os_thread_id = gevent_monkey.get_original('_thread', 'get_ident')()
+            self._sleep = gevent_monkey.get_original('time', 'sleep')
+            self._stopping = False
+            self._finished = gevent_monkey.get_original('_thread', 'allocate_lock')()
+            self._finished.acquire()
+            gevent_monkey.get_original('_thread', 'start_new_thread')(self._sample, ())
+        else:
+            self._greenlet = None
+            self._stop = threading.Event()
+            self._sampler = threading.Thread(target=self._sample, daemon=True)
+            self._sampler.start()
+
+    def _wait(self):
+        if self._greenlet is None:
+            return self._stop.wait(self.interval)
+        self._sleep(self.interval)
+        return self._stopping
+
+    def _current_frame(self):
+        if self._greenlet is None:
+            return sys._current_frames().get(self.thread_id)
+        # gr_frame is only set while the greenlet is switched out; otherwise it is the one running
+        frame = self._greenlet.gr_frame
+        return frame if frame is not None else sys._current_frames().get(self._os_thread_id)
+
+    def _sample(self):
+        try:
+            while not self._wait():
+                frame = self._current_frame()
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                if stack:
+                    self.samples[';'.join(reversed(stack))] += 1
+        finally:
+            if self._greenlet is not None:
+                self._finished.release()
+
+    def stop(self):
+        if self.profile is not None:
+            self.profile.disable()
+        if self._greenlet is None:
+            self._stop.set()
+            self._sampler.join()
+        else:
+            self._stopping = True
+            # Blocks the worker for at most one sample interval
+            self._finished.acquire()
+        return time.perf_counter() - self.started
+
+    def top_functions(self):
+        if self.profile is None:
+            return []
+        stats = pstats.Stats(self.profile).stats
+        rows = [
+            {'function': f"{func} ({_short_path(filename)}:{line})", 'calls': calls,
+             'own_ms': round(own * 1000, 2), 'cumulative_ms': round(cumulative * 1000, 2)}
+            for (filename, line, func), (_, calls, own, cumulative, _) in stats.items()
+        ]
+        return sorted(rows, key=lambda row: row['cumulative_ms'], reverse=True)[:TOP_FUNCTIONS]
+
+    def collapsed(self):
+        return '\n'.join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+
+class RequestProfiler:
+    def __init__(self, directory, keep=200, interval=0.001):
+        self.directory = directory
+        self.keep = keep
+        self.interval = interval
+        self._sessions = {}
+        self._engines = []
+        self._lock = threading.Lock()
+
+    # ----- lifecycle -----
+    def start(self, engines):
+        session = ProfileSession(self.interval)
+        with self._lock:
+            self._sessions[session.thread_id] = session
+            if not self._engines:
+                self._engines = list(engines)
+                for engine in self._engines:
+                    event.listen(engine, 'before_cursor_execute', self._before_execute)
+                    event.listen(engine, 'after_cursor_execute', self._after_execute)
+        return session
+
+    def finish(self, session, meta):
+        """Stop profiling and store the report; returns its id."""
+        duration = session.stop()
+        self._release(session)
+
+        report_id = f"{session.started_at.strftime('%Y%m%d-%H%M%S-%f')}-{uuid.uuid4().hex[:6]}"
+        report = {
+            **meta,
+            'id': report_id,
+            'created_at': session.started_at.isoformat(),
+            'duration_ms': round(duration * 1000, 2),
+            'sql_count': len(session.queries),
+            'sql_ms': round(sum(query['duration_ms'] for query in session.queries), 2),
+            'queries': session.queries,
+            'top_functions': session.top_functions(),
+            'samples': sum(session.samples.values()),
+            'collapsed': session.collapsed(),
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, f"{report_id}.json"), 'w') as f:
+            json.dump(report, f)
+        self._prune()
+        return report_id
+
+    def abandon(self, session):
+        """Stop a profile whose request failed before a response existed."""
+        session.stop()
+        self._release(session)
+
+    def _release(self, session):
+        with self._lock:
+            self._sessions.pop(session.thread_id, None)
+            if not self._sessions:
+                for engine in self._engines:
+                    event.remove(engine, 'before_cursor_execute', self._before_execute)
+                    event.remove(engine, 'after_cursor_execute', self._after_execute)
+                self._engines = []
+
+    # ----- SQL timeline -----
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        session = self._sessions.get(threading.get_ident())
+        if session is not None:
+            session.pending_queries.append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        session = self._sessions.get(threading.get_ident())
+        if session is None or not session.pending_queries:
+            return
+        started = session.pending_queries.pop()
+        session.queries.append({
+            'start_ms': round((started - session.started) * 1000, 2),
+            'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+            # Statements only: parameters can hold personal data
+            'statement': ' '.join(statement.split())[:MAX_STATEMENT_LENGTH],
+            'bind': conn.engine.url.database,
+        })
+
+    # ----- stored reports -----
+    def _report_files(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted((name for name in os.listdir(self.directory) if name.endswith('.json')), reverse=True)
+
+    def _prune(self):
+        for name in self._report_files()[self.keep:]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def reports(self):
+        """Summaries of stored reports, newest first."""
+        summaries = []
+        for name in self._report_files():
+            report = self.load(name[:-len('.json')])
+            if report:
+                summaries.append({key: report.get(key) for key in
+                                  ('id', 'created_at', 'method', 'path', 'endpoint', 'status',
+                                   'user', 'duration_ms', 'sql_count', 'sql_ms')})
+        return summaries
+
+    def load(self, report_id):
+        if not report_id.replace('-', '').isalnum():
+            return None
+        try:
+            with open(os.path.join(self.directory, f"{report_id}.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
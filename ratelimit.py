@@ -0,0 +1,140 @@
+"""
+Token-bucket rate limiting shared by every gunicorn worker
+
+Limits are written "scope:count/period[:METHODS]", e.g. "ip:10/minute:POST"
+or "user:120/minute". A bucket holds up to `count` tokens and refills at
+count/period per second, so short bursts are allowed but the sustained
+rate is capped. Scope "ip" keys the bucket by client address, "user" by
+the logged-in user (falling back to the address for anonymous requests).
+
+Buckets live in an anonymous shared memory map created when app.py is
+imported. Under `gunicorn --preload` that happens in the master, so every
+forked worker (including ones recycled later) sees the same buckets and
+counters; a process-shared lock guards each update, which takes a few
+microseconds. The table has a fixed number of slots: when a probe finds
+no free slot, the bucket that has been idle longest is reused, since a
+refilled bucket is indistinguishable from a new one.
+"""
+import math
+import mmap
+import time
+import struct
+import hashlib
+import multiprocessing
+from collections import namedtuple
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+SCOPES = ('ip', 'user')
+
+# key hash, tokens left, last update (monotonic seconds)
+SLOT = struct.Struct('=Qdd')
+COUNTER = struct.Struct('=QQ')  # allowed, limited
+PROBES = 8
+
+Limit = namedtuple('Limit', 'scope count period methods spec')
+
+
+def parse_limit(spec):
+    """Parse "scope:count/period[:METHOD,METHOD]" into a Limit."""
+    parts = spec.split(':')
+    if len(parts) not in (2, 3) or parts[0] not in SCOPES or '/' not in parts[1]:
+        raise ValueError(f"Invalid rate limit '{spec}' (expected e.g. 'ip:10/minute:POST')")
+    count, period = parts[1].split('/', 1)
+    if period not in PERIODS:
+        raise ValueError(f"Invalid rate limit period '{period}' (use {', '.join(PERIODS)})")
+    methods = frozenset(m.strip().upper() for m in parts[2].split(',')) if len(parts) == 3 else None
+    return Limit(parts[0], int(count), PERIODS[period], methods, spec)
+
+
+class SharedBucketStore:
+    def __init__(self, slots=65536, counters=256):
+        self.slots = slots
+        self.counters = counters
+        # Anonymous mmaps are MAP_SHARED, so forked children write to the same pages
+        self.table = mmap.mmap(-1, slots * SLOT.size)
+        self.counts = mmap.mmap(-1, counters * COUNTER.size)
+        self.lock = multiprocessing.Lock()
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little') or 1
+
+    def take(self, key, count, period, counter=None, now=None):
+        """Take one token from `key`'s bucket. Returns (allowed, retry_after_seconds)."""
+        now = time.monotonic() if now is None else now
+        rate = count / period
+        key_hash = self._hash(key)
+        start = key_hash % self.slots
+
+        with self.lock:
+            slot, tokens = None, float(count)
+            oldest, oldest_updated = None, math.inf
+            for probe in range(PROBES):
+                index = (start + probe) % self.slots
+                stored_hash, stored_tokens, updated = SLOT.unpack_from(self.table, index * SLOT.size)
+                if stored_hash == key_hash:
+                    slot = index
+                    tokens = min(count, stored_tokens + (now - updated) * rate)
+                    break
+                if stored_hash == 0:
+                    slot = index
+                    break
+                if updated < oldest_updated:
+                    oldest, oldest_updated = index, updated
+            if slot is None:
+                slot = oldest
+
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            SLOT.pack_into(self.table, slot * SLOT.size, key_hash, tokens, now)
+
+            if counter is not None:
+                offset = (counter % self.counters) * COUNTER.size
+                allowed_count, limited_count = COUNTER.unpack_from(self.counts, offset)
+                COUNTER.pack_into(self.counts, offset, allowed_count + allowed, limited_count + (not allowed))
+
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+    def counter(self, index):
+        with self.lock:
+            return COUNTER.unpack_from(self.counts, (index % self.counters) * COUNTER.size)
+
+    def occupancy(self):
+        with self.lock:
+            return sum(1 for index in range(self.slots) if SLOT.unpack_from(self.table, index * SLOT.size)[0])
+
+
+class RateLimiter:
+    """Per-endpoint limits checked against a SharedBucketStore."""
+
+    def __init__(self, rules, slots=65536):
+        # endpoint -> [(counter index, Limit)]
+        self.rules = {}
+        self.labels = []
+        for endpoint, specs in rules.items():
+            for spec in specs:
+                limit = spec if isinstance(spec, Limit) else parse_limit(spec)
+                self.rules.setdefault(endpoint, []).append((len(self.labels), limit))
+                self.labels.append((endpoint, limit.spec))
+        self.store = SharedBucketStore(slots=slots, counters=max(1, len(self.labels)))
+
+    def check(self, endpoint, method, ip, user_id=None):
+        """None if the request may proceed, else seconds until it would be allowed."""
+        retry_after = None
+        for index, limit in self.rules.get(endpoint, ()):
+            if limit.methods and method not in limit.methods:
+                continue
+            identity = f"user:{user_id}" if limit.scope == 'user' and user_id is not None else f"ip:{ip}"
+            allowed, wait = self.store.take(f"{endpoint}|{limit.spec}|{identity}", limit.count, limit.period,
+                                            counter=index)
+            if not allowed:
+                retry_after = max(retry_after or 0, wait)
+        return None if retry_after is None else max(1, math.ceil(retry_after))
+
+    def stats(self):
+        rules = []
+        for index, (endpoint, spec) in enumerate(self.labels):
+            allowed, limited = self.store.counter(index)
+            rules.append({'endpoint': endpoint, 'limit': spec, 'allowed': allowed, 'limited': limited})
+        return {'rules': rules, 'buckets_in_use': self.store.occupancy(), 'bucket_slots': self.store.slots}
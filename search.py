@@ -0,0 +1,403 @@
+"""
+Full-text search over lessons and subjects
+
+PostgreSQL: weighted tsvector expressions with GIN expression indexes. The
+queries repeat the exact indexed expression so the planner uses the index,
+and Postgres keeps it current on every INSERT/UPDATE.
+
+Text extracted from uploaded documents (lesson_documents.content_text) is
+searched too, at a lower weight than titles and descriptions.
+
+SQLite: FTS5 tables (lesson_fts, subject_fts) keyed by rowid = primary key,
+kept in sync by index_lesson()/index_subject() from the admin create/edit
+routes and the document extraction stage.
+
+Anything else (or SQLite built without FTS5) falls back to LIKE matching.
+"""
+import math
+import re
+
+from markupsafe import Markup, escape
+from sqlalchemy import text
+
+# Snippet highlight markers, swapped for <mark> after HTML escaping
+HIGHLIGHT_START = '\x01'
+HIGHLIGHT_END = '\x02'
+
+MAX_QUERY_TERMS = 10
+
+
+def lesson_vector(prefix=''):
+    return (f"setweight(to_tsvector('english', coalesce({prefix}title, '')), 'A') || "
+            f"setweight(to_tsvector('english', coalesce({prefix}description, '')), 'B')")
+
+
+def document_vector(prefix=''):
+    return f"setweight(to_tsvector('english', coalesce({prefix}content_text, '')), 'C')"
+
+
+def subject_vector(prefix=''):
+    return (f"setweight(to_tsvector('english', coalesce({prefix}name, '')), 'A') || "
+            f"setweight(to_tsvector('english', coalesce({prefix}description, '')), 'B')")
+
+
+def highlight(snippet):
+    """Escape a search snippet and turn the highlight markers into <mark> tags."""
+    return escape(snippet or '').replace(HIGHLIGHT_START, Markup('<mark>')).replace(HIGHLIGHT_END, Markup('</mark>'))
+
+
+def plain_snippet(snippet):
+    return (snippet or '').replace(HIGHLIGHT_START, '').replace(HIGHLIGHT_END, '')
+
+
+def query_terms(query):
+    return re.findall(r'\w+', query or '', re.UNICODE)[:MAX_QUERY_TERMS]
+
+
+class SearchPage:
+    """One page of ranked hits, shaped like a Flask-SQLAlchemy Pagination."""
+
+    def __init__(self, items, total, page, per_page):
+        self.items = items
+        self.total = total
+        self.page = page
+        self.per_page = per_page
+
+    @property
+    def pages(self):
+        return max(1, math.ceil(self.total / self.per_page)) if self.per_page else 1
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def has_next(self):
+        return self.page < self.pages
+
+    @property
+    def prev_num(self):
+        return self.page - 1 if self.has_prev else None
+
+    @property
+    def next_num(self):
+        return self.page + 1 if self.has_next else None
+
+
+def _lesson_filters(published_only, subject_id, params):
+    clauses = []
+    if published_only:
+        clauses.append("l.is_published = :true AND s.is_active = :true")
+        params['true'] = True
+    if subject_id:
+        clauses.append("l.subject_id = :subject_id")
+        params['subject_id'] = subject_id
+    return ''.join(f" AND {clause}" for clause in clauses)
+
+
+def _subject_filters(published_only, params):
+    if published_only:
+        params['true'] = True
+        return " AND s.is_active = :true"
+    return ''
+
+
+# ============ POSTGRES ============
+class PostgresSearchBackend:
+    name = 'postgres'
+
+    HEADLINE_OPTIONS = f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}, MaxWords=30, MinWords=12"
+
+    def ensure_schema(self, connection):
+        connection.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_lessons_fulltext ON lessons USING GIN (({lesson_vector()}))"
+        ))
+        connection.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_subjects_fulltext ON subjects USING GIN (({subject_vector()}))"
+        ))
+        connection.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_lesson_documents_fulltext "
+            f"ON lesson_documents USING GIN (({document_vector()}))"
+        ))
+
+    def rebuild(self, connection):
+        connection.execute(text("REINDEX INDEX ix_lessons_fulltext"))
+        connection.execute(text("REINDEX INDEX ix_subjects_fulltext"))
+        connection.execute(text("REINDEX INDEX ix_lesson_documents_fulltext"))
+
+    def index_lesson(self, session, lesson, body):
+        pass  # maintained by the expression indexes
+
+    def index_subject(self, session, subject):
+        pass
+
+    def search_lessons(self, session, query, page, per_page, published_only, subject_id):
+        if not query_terms(query):
+            return SearchPage([], 0, page, per_page)
+
+        params = {'q': query, 'limit': per_page, 'offset': (page - 1) * per_page,
+                  'options': self.HEADLINE_OPTIONS}
+        # Each half of the UNION can use its own GIN index
+        where = f"""l.id IN (
+            SELECT id FROM lessons WHERE ({lesson_vector()}) @@ websearch_to_tsquery('english', :q)
+            UNION
+            SELECT lesson_id FROM lesson_documents WHERE ({document_vector()}) @@ websearch_to_tsquery('english', :q)
+        )""" + _lesson_filters(published_only, subject_id, params)
+        source = ("FROM lessons l JOIN subjects s ON s.id = l.subject_id "
+                  "LEFT JOIN lesson_documents d ON d.lesson_id = l.id, websearch_to_tsquery('english', :q) q")
+
+        total = session.execute(text(f"SELECT count(*) {source} WHERE {where}"), params).scalar()
+        rows = session.execute(text(f"""
+            SELECT id, subject_id, subject_name, title, week_number, day_number, content_type, rank,
+                   ts_headline('english', coalesce(nullif(preview, ''), title), q, :options) AS snippet
+            FROM (
+                SELECT l.id, l.subject_id, s.name AS subject_name, l.title,
+                       coalesce(l.description, '') || ' ' || left(coalesce(d.content_text, ''), 5000) AS preview,
+                       l.week_number, l.day_number, l.content_type, q,
+                       ts_rank({lesson_vector('l.')} || {document_vector('d.')}, q) AS rank
+                {source}
+                WHERE {where}
+                ORDER BY rank DESC, l.id
+                LIMIT :limit OFFSET :offset
+            ) hits
+            ORDER BY rank DESC, id
+        """), params).mappings().all()
+        return SearchPage([dict(row) for row in rows], total, page, per_page)
+
+    def search_subjects(self, session, query, page, per_page, published_only):
+        if not query_terms(query):
+            return SearchPage([], 0, page, per_page)
+
+        params = {'q': query, 'limit': per_page, 'offset': (page - 1) * per_page,
+                  'options': self.HEADLINE_OPTIONS}
+        where = f"({subject_vector('s.')}) @@ q" + _subject_filters(published_only, params)
+        source = "FROM subjects s, websearch_to_tsquery('english', :q) q"
+
+        total = session.execute(text(f"SELECT count(*) {source} WHERE {where}"), params).scalar()
+        rows = session.execute(text(f"""
+            SELECT s.id, s.name, s.code, s.icon, s.color,
+                   ts_rank({subject_vector('s.')}, q) AS rank,
+                   ts_headline('english', coalesce(nullif(s.description, ''), s.name), q, :options) AS snippet
+            {source}
+            WHERE {where}
+            ORDER BY rank DESC, s.id
+            LIMIT :limit OFFSET :offset
+        """), params).mappings().all()
+        return SearchPage([dict(row) for row in rows], total, page, per_page)
+
+
+# ============ SQLITE FTS5 ============
+class SqliteSearchBackend:
+    name = 'sqlite-fts5'
+
+    def ensure_schema(self, connection):
+        # Tables created before document text was indexed lack the body column
+        columns = [row[1] for row in connection.execute(text("PRAGMA table_info(lesson_fts)"))]
+        if columns and 'body' not in columns:
+            connection.execute(text("DROP TABLE lesson_fts"))
+
+        connection.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS lesson_fts "
+            "USING fts5(title, description, body, tokenize='porter unicode61')"
+        ))
+        connection.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS subject_fts "
+            "USING fts5(name, description, tokenize='porter unicode61')"
+        ))
+
+        # First run (or a freshly reset database): index what is already there
+        if not connection.execute(text("SELECT count(*) FROM lesson_fts")).scalar():
+            self._backfill(connection)
+
+    def rebuild(self, connection):
+        connection.execute(text("DELETE FROM lesson_fts"))
+        connection.execute(text("DELETE FROM subject_fts"))
+        self._backfill(connection)
+
+    def _backfill(self, connection):
+        connection.execute(text(
+            "INSERT INTO lesson_fts(rowid, title, description, body) "
+            "SELECT l.id, coalesce(l.title, ''), coalesce(l.description, ''), coalesce(d.content_text, '') "
+            "FROM lessons l LEFT JOIN lesson_documents d ON d.lesson_id = l.id"
+        ))
+        connection.execute(text("DELETE FROM subject_fts"))
+        connection.execute(text(
+            "INSERT INTO subject_fts(rowid, name, description) "
+            "SELECT id, coalesce(name, ''), coalesce(description, '') FROM subjects"
+        ))
+
+    def index_lesson(self, session, lesson, body):
+        session.execute(
+            text("INSERT OR REPLACE INTO lesson_fts(rowid, title, description, body) "
+                 "VALUES (:id, :title, :description, :body)"),
+            {'id': lesson.id, 'title': lesson.title or '', 'description': lesson.description or '', 'body': body}
+        )
+
+    def index_subject(self, session, subject):
+        session.execute(
+            text("INSERT OR REPLACE INTO subject_fts(rowid, name, description) VALUES (:id, :name, :description)"),
+            {'id': subject.id, 'name': subject.name or '', 'description': subject.description or ''}
+        )
+
+    @staticmethod
+    def match_expression(query):
+        # Quote every term so user input can never be parsed as FTS5 syntax
+        return ' '.join(f'"{term}"*' for term in query_terms(query))
+
+    def search_lessons(self, session, query, page, per_page, published_only, subject_id):
+        match = self.match_expression(query)
+        if not match:
+            return SearchPage([], 0, page, per_page)
+
+        params = {'match': match, 'limit': per_page, 'offset': (page - 1) * per_page,
+                  'start': HIGHLIGHT_START, 'end': HIGHLIGHT_END}
+        source = ("FROM lesson_fts JOIN lessons l ON l.id = lesson_fts.rowid "
+                  "JOIN subjects s ON s.id = l.subject_id")
+        where = "lesson_fts MATCH :match" + _lesson_filters(published_only, subject_id, params)
+
+        total = session.execute(text(f"SELECT count(*) {source} WHERE {where}"), params).scalar()
+        rows = session.execute(text(f"""
+            SELECT l.id, l.subject_id, s.name AS subject_name, l.title, l.week_number, l.day_number,
+                   l.content_type, -bm25(lesson_fts, 10.0, 1.0, 0.5) AS rank,
+                   snippet(lesson_fts, -1, :start, :end, '…', 24) AS snippet
+            {source}
+            WHERE {where}
+            ORDER BY rank DESC, l.id
+            LIMIT :limit OFFSET :offset
+        """), params).mappings().all()
+        return SearchPage([dict(row) for row in rows], total, page, per_page)
+
+    def search_subjects(self, session, query, page, per_page, published_only):
+        match = self.match_expression(query)
+        if not match:
+            return SearchPage([], 0, page, per_page)
+
+        params = {'match': match, 'limit': per_page, 'offset': (page - 1) * per_page,
+                  'start': HIGHLIGHT_START, 'end': HIGHLIGHT_END}
+        source = "FROM subject_fts JOIN subjects s ON s.id = subject_fts.rowid"
+        where = "subject_fts MATCH :match" + _subject_filters(published_only, params)
+
+        total = session.execute(text(f"SELECT count(*) {source} WHERE {where}"), params).scalar()
+        rows = session.execute(text(f"""
+            SELECT s.id, s.name, s.code, s.icon, s.color, -bm25(subject_fts, 10.0, 1.0) AS rank,
+                   coalesce(nullif(snippet(subject_fts, 1, :start, :end, '…', 24), ''),
+                            snippet(subject_fts, 0, :start, :end, '…', 24)) AS snippet
+            {source}
+            WHERE {where}
+            ORDER BY rank DESC, s.id
+            LIMIT :limit OFFSET :offset
+        """), params).mappings().all()
+        return SearchPage([dict(row) for row in rows], total, page, per_page)
+
+
+# ============ FALLBACK ============
+class LikeSearchBackend:
+    """Unranked substring search for databases without a full-text engine."""
+    name = 'like'
+
+    def ensure_schema(self, connection):
+        pass
+
+    def rebuild(self, connection):
+        pass
+
+    def index_lesson(self, session, lesson, body):
+        pass
+
+    def index_subject(self, session, subject):
+        pass
+
+    @staticmethod
+    def _term_clauses(terms, columns, params):
+        clauses = []
+        for i, term in enumerate(terms):
+            params[f'term{i}'] = f'%{term.lower()}%'
+            clauses.append('(' + ' OR '.join(f"lower({c}) LIKE :term{i}" for c in columns) + ')')
+        return ' AND '.join(clauses)
+
+    def search_lessons(self, session, query, page, per_page, published_only, subject_id):
+        terms = query_terms(query)
+        if not terms:
+            return SearchPage([], 0, page, per_page)
+
+        params = {'limit': per_page, 'offset': (page - 1) * per_page}
+        where = (self._term_clauses(terms, ['l.title', "coalesce(l.description, '')"], params)
+                 + _lesson_filters(published_only, subject_id, params))
+        source = "FROM lessons l JOIN subjects s ON s.id = l.subject_id"
+
+        total = session.execute(text(f"SELECT count(*) {source} WHERE {where}"), params).scalar()
+        rows = session.execute(text(f"""
+            SELECT l.id, l.subject_id, s.name AS subject_name, l.title, l.week_number, l.day_number,
+                   l.content_type, 0 AS rank, l.description AS snippet
+            {source}
+            WHERE {where}
+            ORDER BY l.id
+            LIMIT :limit OFFSET :offset
+        """), params).mappings().all()
+        return SearchPage([dict(row) for row in rows], total, page, per_page)
+
+    def search_subjects(self, session, query, page, per_page, published_only):
+        terms = query_terms(query)
+        if not terms:
+            return SearchPage([], 0, page, per_page)
+
+        params = {'limit': per_page, 'offset': (page - 1) * per_page}
+        where = (self._term_clauses(terms, ['s.name', "coalesce(s.description, '')"], params)
+                 + _subject_filters(published_only, params))
+
+        total = session.execute(text(f"SELECT count(*) FROM subjects s WHERE {where}"), params).scalar()
+        rows = session.execute(text(f"""
+            SELECT s.id, s.name, s.code, s.icon, s.color, 0 AS rank, s.description AS snippet
+            FROM subjects s
+            WHERE {where}
+            ORDER BY s.name
+            LIMIT :limit OFFSET :offset
+        """), params).mappings().all()
+        return SearchPage([dict(row) for row in rows], total, page, per_page)
+
+
+# ============ PUBLIC INTERFACE ============
+class SearchIndex:
+    def __init__(self):
+        self.db = None
+        self.backend = LikeSearchBackend()
+
+    def ensure_schema(self, db):
+        """Pick a backend for the bound database and create its index structures."""
+        self.db = db
+        dialect = db.engine.dialect.name
+        if dialect == 'postgresql':
+            backend = PostgresSearchBackend()
+        elif dialect == 'sqlite':
+            backend = SqliteSearchBackend()
+        else:
+            backend = LikeSearchBackend()
+
+        try:
+            with db.engine.begin() as connection:
+                backend.ensure_schema(connection)
+        except Exception as e:
+            print(f"⚠️  Full-text search unavailable ({e}), using LIKE search")
+            backend = LikeSearchBackend()
+
+        self.backend = backend
+        print(f"✅ Search backend: {backend.name}")
+
+    def rebuild(self):
+        with self.db.engine.begin() as connection:
+            self.backend.rebuild(connection)
+
+    def index_lesson(self, lesson):
+        document = getattr(lesson, 'document', None)
+        body = (document.content_text if document else None) or ''
+        self.backend.index_lesson(self.db.session, lesson, body)
+
+    def index_subject(self, subject):
+        self.backend.index_subject(self.db.session, subject)
+
+    def search_lessons(self, query, page=1, per_page=20, published_only=True, subject_id=None):
+        return self.backend.search_lessons(self.db.session, query, max(page, 1), per_page,
+                                           published_only, subject_id)
+
+    def search_subjects(self, query, page=1, per_page=20, published_only=True):
+        return self.backend.search_subjects(self.db.session, query, max(page, 1), per_page, published_only)
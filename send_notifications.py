@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Send queued email/SMS notifications
+
+The web app only queues notifications (approved payments and bursaries);
+this worker also queues subscription-ending reminders, then sends
+everything due in batches through the channels configured with
+NOTIFY_EMAIL_BACKEND / NOTIFY_SMS_BACKEND (see notifications.py).
+
+    python send_notifications.py               # send what is due, then exit
+    python send_notifications.py --watch       # keep running (the deployed worker)
+    NOTIFY_EMAIL_BACKEND=file python send_notifications.py --verbose
+"""
+import sys
+import time
+import argparse
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Send queued email/SMS notifications')
+    parser.add_argument('--batch-size', type=int, default=100, help='notifications claimed at a time')
+    parser.add_argument('--watch', action='store_true', help='keep running and poll for new notifications')
+    parser.add_argument('--interval', type=int, default=15, help='seconds between polls with --watch')
+    parser.add_argument('--reminder-interval', type=int, default=3600,
+                        help='seconds between scans for subscriptions about to end')
+    parser.add_argument('--verbose', action='store_true', help='print every failed send')
+    args = parser.parse_args()
+
+    # Imported here so --help does not initialise the whole app
+    from app import app, db, dispatch_notifications, queue_expiry_reminders
+
+    with app.app_context():
+        reminders_at = 0
+        while True:
+            try:
+                if time.time() - reminders_at >= args.reminder_interval:
+                    queued = queue_expiry_reminders()
+                    reminders_at = time.time()
+                    if queued:
+                        print(f"⏰ Queued {queued} subscription reminder(s)")
+
+                while True:
+                    sent, failed = dispatch_notifications(args.batch_size, verbose=args.verbose)
+                    if sent or failed:
+                        print(f"📨 Sent {sent}, failed {failed}")
+                    if sent + failed < args.batch_size:
+                        break
+            except Exception as e:
+                # Keep the worker alive through a database or provider outage
+                db.session.rollback()
+                print(f"❌ Notification dispatch failed: {e}")
+                if not args.watch:
+                    return 1
+
+            if not args.watch:
+                break
+            time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
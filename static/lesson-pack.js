@@ -0,0 +1,83 @@
+// Offline lesson packs - page side
+// Registers the service worker, downloads a subject's lesson pack (automatically
+// once a day on Wi-Fi, on request otherwise) and asks the worker to sync queued
+// progress as soon as the connection comes back.
+
+(function() {
+    if (!('serviceWorker' in navigator)) {
+        return;
+    }
+
+    const AUTO_DOWNLOAD_INTERVAL = 24 * 60 * 60 * 1000;
+
+    function onUnmeteredConnection() {
+        const connection = navigator.connection;
+        if (!connection) {
+            return false;
+        }
+        if (connection.saveData) {
+            return false;
+        }
+        return connection.type === 'wifi' || connection.type === 'ethernet';
+    }
+
+    function setStatus(button, text) {
+        const status = document.querySelector(button.dataset.statusTarget || '[data-lesson-pack-status]');
+        if (status) {
+            status.textContent = text;
+        }
+    }
+
+    function postToWorker(message) {
+        return navigator.serviceWorker.ready.then(registration => registration.active.postMessage(message));
+    }
+
+    function requestPack(button) {
+        button.disabled = true;
+        setStatus(button, 'Downloading lessons for offline use...');
+        postToWorker({ type: 'download-pack', manifestUrl: button.dataset.manifestUrl });
+        localStorage.setItem('lessonPack:' + button.dataset.manifestUrl, String(Date.now()));
+    }
+
+    function flushProgress() {
+        postToWorker({ type: 'flush-progress' });
+    }
+
+    navigator.serviceWorker.register('/sw.js', { scope: '/' }).then(flushProgress).catch(() => {});
+
+    navigator.serviceWorker.addEventListener('message', event => {
+        const button = document.querySelector('[data-lesson-pack]');
+        if (!button) {
+            return;
+        }
+        if (event.data.type === 'pack-ready') {
+            button.disabled = false;
+            setStatus(button, `${event.data.cached} of ${event.data.total} files available offline.`);
+        } else if (event.data.type === 'pack-failed') {
+            button.disabled = false;
+            setStatus(button, 'Download failed. Check your connection and try again.');
+        }
+    });
+
+    window.addEventListener('online', flushProgress);
+
+    document.addEventListener('DOMContentLoaded', function() {
+        const button = document.querySelector('[data-lesson-pack]');
+        if (!button) {
+            return;
+        }
+
+        button.addEventListener('click', function() {
+            if (!onUnmeteredConnection() && navigator.connection &&
+                !confirm('You seem to be on mobile data. Download this week\'s lessons anyway?')) {
+                return;
+            }
+            requestPack(button);
+        });
+
+        const lastDownload = parseInt(localStorage.getItem('lessonPack:' + button.dataset.manifestUrl) || '0', 10);
+        if (onUnmeteredConnection() && Date.now() - lastDownload > AUTO_DOWNLOAD_INTERVAL) {
+            requestPack(button);
+        }
+    });
+})();
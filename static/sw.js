@@ -0,0 +1,242 @@
+// Offline lesson packs - Service Worker
+// Pre-caches the lesson pages and media listed in a subject's lesson pack,
+// serves them when the network is gone, and queues "mark complete" clicks
+// in IndexedDB until they can be synced back in one batched request.
+
+const PACK_CACHE = 'tfv-lesson-packs-v1';
+const DB_NAME = 'tfv-offline';
+const PROGRESS_STORE = 'progress';
+const SYNC_URL = '/api/progress/sync';
+
+self.addEventListener('install', () => self.skipWaiting());
+
+self.addEventListener('activate', event => {
+    event.waitUntil(
+        caches.keys()
+            .then(keys => Promise.all(
+                keys.filter(key => key.startsWith('tfv-lesson-packs-') && key !== PACK_CACHE)
+                    .map(key => caches.delete(key))
+            ))
+            .then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener('message', event => {
+    const data = event.data || {};
+
+    if (data.type === 'download-pack') {
+        event.waitUntil(
+            downloadPack(data.manifestUrl)
+                .then(result => notify(event.source, { type: 'pack-ready', ...result }))
+                .catch(error => notify(event.source, { type: 'pack-failed', error: String(error) }))
+        );
+    } else if (data.type === 'flush-progress') {
+        event.waitUntil(flushProgress());
+    }
+});
+
+self.addEventListener('sync', event => {
+    if (event.tag === 'progress-sync') {
+        event.waitUntil(flushProgress());
+    }
+});
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    const url = new URL(request.url);
+
+    if (url.origin !== self.location.origin || request.method !== 'GET') {
+        return;
+    }
+
+    if (url.pathname.startsWith('/mark_complete/')) {
+        event.respondWith(markComplete(request, url));
+    } else if (url.pathname.startsWith('/uploads/')) {
+        event.respondWith(cacheFirst(request));
+    } else if (url.pathname.startsWith('/lesson/') || url.pathname.startsWith('/static/')) {
+        event.respondWith(networkFirst(request));
+    }
+});
+
+
+// ============ PACK DOWNLOAD ============
+async function downloadPack(manifestUrl) {
+    const response = await fetch(manifestUrl, { credentials: 'same-origin' });
+    if (!response.ok) {
+        throw new Error(`Lesson pack unavailable (${response.status})`);
+    }
+
+    const cache = await caches.open(PACK_CACHE);
+    await cache.put(manifestUrl, response.clone());
+    const pack = await response.json();
+
+    let cached = 0;
+    // One request at a time: students are often on a shared, slow connection
+    for (const url of pack.urls) {
+        if (await cache.match(url, { ignoreVary: true })) {
+            cached++;
+            continue;
+        }
+        const request = new Request(url, {
+            credentials: 'same-origin',
+            headers: { 'X-Lesson-Pack': '1' }
+        });
+        try {
+            const asset = await fetch(request);
+            if (asset.ok) {
+                await cache.put(url, asset);
+                cached++;
+            }
+        } catch (error) {
+            // Keep going - a partial pack is still useful
+        }
+    }
+
+    return { subjectId: pack.subject_id, version: pack.version, cached: cached, total: pack.urls.length };
+}
+
+
+// ============ FETCH STRATEGIES ============
+async function networkFirst(request) {
+    try {
+        const response = await fetch(request);
+        if (response.ok) {
+            const cache = await caches.open(PACK_CACHE);
+            if (await cache.match(request, { ignoreVary: true })) {
+                await cache.put(request, response.clone());
+            }
+        }
+        return response;
+    } catch (error) {
+        const cached = await caches.match(request, { ignoreVary: true, ignoreSearch: true });
+        return cached || offlineResponse();
+    }
+}
+
+async function cacheFirst(request) {
+    const cached = await caches.match(request.url, { ignoreVary: true });
+    if (cached) {
+        const range = request.headers.get('Range');
+        return range ? rangeResponse(cached, range) : cached;
+    }
+    try {
+        return await fetch(request);
+    } catch (error) {
+        return offlineResponse();
+    }
+}
+
+async function rangeResponse(response, rangeHeader) {
+    // Media elements ask for byte ranges; the cache only holds whole files
+    const blob = await response.blob();
+    const match = /bytes=(\d*)-(\d*)/.exec(rangeHeader);
+    if (!match) {
+        return new Response(blob, { status: 200, headers: response.headers });
+    }
+    const start = match[1] ? parseInt(match[1], 10) : Math.max(blob.size - parseInt(match[2], 10), 0);
+    const end = match[1] && match[2] ? Math.min(parseInt(match[2], 10), blob.size - 1) : blob.size - 1;
+    const headers = new Headers(response.headers);
+    headers.set('Content-Range', `bytes ${start}-${end}/${blob.size}`);
+    headers.set('Content-Length', String(end - start + 1));
+    return new Response(blob.slice(start, end + 1), { status: 206, headers: headers });
+}
+
+function offlineResponse() {
+    return new Response('<h1>You are offline</h1><p>This page is not in your downloaded lessons.</p>', {
+        status: 503,
+        headers: { 'Content-Type': 'text/html; charset=utf-8' }
+    });
+}
+
+
+// ============ OFFLINE PROGRESS ============
+async function markComplete(request, url) {
+    try {
+        return await fetch(request);
+    } catch (error) {
+        const lessonId = parseInt(url.pathname.split('/').pop(), 10);
+        await queueProgress({
+            lesson_id: lessonId,
+            completed: true,
+            percentage: 100,
+            recorded_at: Date.now()
+        });
+        if (self.registration.sync) {
+            self.registration.sync.register('progress-sync').catch(() => {});
+        }
+        const back = request.referrer || new URL(`/lesson/${lessonId}`, self.location.origin).href;
+        return Response.redirect(back, 303);
+    }
+}
+
+async function flushProgress() {
+    const queued = await readQueue();
+    if (!queued.length) {
+        return;
+    }
+
+    const response = await fetch(SYNC_URL, {
+        method: 'POST',
+        credentials: 'same-origin',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ events: queued.map(item => item.value) })
+    });
+
+    if (response.ok) {
+        await deleteKeys(queued.map(item => item.key));
+    }
+}
+
+function openDb() {
+    return new Promise((resolve, reject) => {
+        const request = indexedDB.open(DB_NAME, 1);
+        request.onupgradeneeded = () => request.result.createObjectStore(PROGRESS_STORE, { autoIncrement: true });
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+async function queueProgress(event) {
+    const db = await openDb();
+    return new Promise((resolve, reject) => {
+        const tx = db.transaction(PROGRESS_STORE, 'readwrite');
+        tx.objectStore(PROGRESS_STORE).add(event);
+        tx.oncomplete = () => resolve();
+        tx.onerror = () => reject(tx.error);
+    });
+}
+
+async function readQueue() {
+    const db = await openDb();
+    return new Promise((resolve, reject) => {
+        const items = [];
+        const tx = db.transaction(PROGRESS_STORE, 'readonly');
+        const cursorRequest = tx.objectStore(PROGRESS_STORE).openCursor();
+        cursorRequest.onsuccess = () => {
+            const cursor = cursorRequest.result;
+            if (cursor) {
+                items.push({ key: cursor.key, value: cursor.value });
+                cursor.continue();
+            }
+        };
+        tx.oncomplete = () => resolve(items);
+        tx.onerror = () => reject(tx.error);
+    });
+}
+
+async function deleteKeys(keys) {
+    const db = await openDb();
+    return new Promise((resolve, reject) => {
+        const tx = db.transaction(PROGRESS_STORE, 'readwrite');
+        const store = tx.objectStore(PROGRESS_STORE);
+        keys.forEach(key => store.delete(key));
+        tx.oncomplete = () => resolve();
+        tx.onerror = () => reject(tx.error);
+    });
+}
+
+function notify(client, message) {
+    if (client) {
+        client.postMessage(message);
+    }
+}
@@ -0,0 +1,43 @@
+"""
+Template precompilation
+
+Jinja compiles a template to Python source and then to bytecode the first
+time it is rendered, which costs tens of milliseconds for the large pages
+(pricing, lesson, admin_create_lesson) on every new worker. Two things take
+that off the request path:
+
+- a FileSystemBytecodeCache: compiled bytecode is written to disk (keyed by
+  template name and source checksum, so an edited template is recompiled)
+  and later processes only unmarshal it
+- precompile(): loads every template at startup. Under `gunicorn --preload`
+  this happens once in the master, and forked workers inherit the compiled
+  templates copy-on-write
+
+bench_templates.py measures the difference.
+"""
+import os
+import time
+
+from jinja2 import FileSystemBytecodeCache, TemplateError
+
+
+def bytecode_cache(directory):
+    os.makedirs(directory, exist_ok=True)
+    return FileSystemBytecodeCache(directory, pattern='%s.jinja')
+
+
+def precompile(env, extensions=('.html',)):
+    """Load (compile or unmarshal) every template into `env`'s cache.
+
+    Returns (templates loaded, seconds, {name: error}); a broken template is
+    reported, not raised, so it cannot stop the app from booting.
+    """
+    started = time.perf_counter()
+    loaded, failures = 0, {}
+    for name in env.list_templates(extensions=[ext.lstrip('.') for ext in extensions]):
+        try:
+            env.get_template(name)
+            loaded += 1
+        except TemplateError as e:
+            failures[name] = str(e)
+    return loaded, time.perf_counter() - started, failures
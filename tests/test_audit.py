@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import subprocess
+
+import pytest
+
+import audit
+from audit import AuditLog
+
+
+class FakeTable:
+    """Stands in for store_audit_rows: skips event_ids it already holds."""
+
+    def __init__(self):
+        self.rows = {}
+        self.fail = False
+
+    def insert(self, rows):
+        if self.fail:
+            raise RuntimeError('database unavailable')
+        new = [row for row in rows if row['event_id'] not in self.rows]
+        for row in new:
+            self.rows[row['event_id']] = row
+        return [row['event_id'] for row in new]
+
+
+@pytest.fixture
+def table():
+    return FakeTable()
+
+
+@pytest.fixture
+def log(tmp_path, table):
+    # A long interval keeps the background compactor out of the way
+    log = AuditLog(str(tmp_path), flush_interval=3600)
+    log.start(table.insert)
+    return log
+
+
+def write_segment(directory, name, entries, tail=''):
+    with open(os.path.join(directory, name), 'w', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + '\n')
+        f.write(tail)
+
+
+def dead_pid():
+    process = subprocess.Popen(['true'])
+    process.wait()
+    return process.pid
+
+
+def stamp(seconds_from_now=0):
+    return int((time.time() + seconds_from_now) * 1000)
+
+
+def test_changes_lists_only_differing_fields():
+    assert audit.changes({'a': 1, 'b': 2}, {'a': 1, 'b': 3, 'c': None}) == {'b': [2, 3]}
+
+
+def test_flush_stores_recorded_entries_and_removes_segments(log, table, tmp_path):
+    ids = [log.record('payment.status', target_id=n) for n in range(3)]
+    assert log.pending() == 1
+
+    assert log.flush() == 3
+    assert sorted(table.rows) == sorted(ids)
+    assert table.rows[ids[0]]['action'] == 'payment.status'
+    assert os.listdir(tmp_path) == []
+    assert log.stats() == {'recorded': 3, 'compacted': 3, 'errors': 0, 'pending_segments': 0}
+
+
+def test_flush_without_insert_function_keeps_segments(tmp_path):
+    log = AuditLog(str(tmp_path), flush_interval=3600)
+    log.record('user.toggle_admin')
+    assert log.flush() == 0
+    assert log.pending() == 1
+
+
+def test_segment_compacted_twice_is_stored_once(log, table, tmp_path):
+    entries = [{'event_id': f"e{n}", 'action': 'payment.review'} for n in range(3)]
+    # A crash between the INSERT and the delete leaves the segment behind to be compacted again
+    write_segment(tmp_path, f"audit-{dead_pid()}-{stamp(-60)}-1.ready", entries)
+    assert log.flush() == 3
+    write_segment(tmp_path, f"audit-{dead_pid()}-{stamp(-60)}-1.ready", entries)
+    assert log.flush() == 0
+    assert len(table.rows) == 3
+
+
+def test_torn_last_line_of_a_killed_writer_is_skipped(log, table, tmp_path):
+    entries = [{'event_id': 'e1', 'action': 'a'}, {'event_id': 'e2', 'action': 'a'}]
+    write_segment(tmp_path, f"audit-{dead_pid()}-{stamp(-60)}-1.open", entries, tail='{"event_id": "e3", "act')
+    assert log.flush() == 2
+    assert sorted(table.rows) == ['e1', 'e2']
+    assert log.pending() == 0
+
+
+def test_dead_compactors_segment_is_picked_up(log, table, tmp_path):
+    name = f"compacting-{dead_pid()}-{stamp(-60)}-audit-{dead_pid()}-{stamp(-120)}-4.ndjson"
+    write_segment(tmp_path, name, [{'event_id': 'e1', 'action': 'a'}])
+    assert log.flush() == 1
+    assert 'e1' in table.rows
+
+
+def test_live_writers_open_segment_is_left_alone(log, table, tmp_path):
+    with subprocess.Popen(['sleep', '30']) as writer:
+        try:
+            write_segment(tmp_path, f"audit-{writer.pid}-{stamp(1)}-1.open", [{'event_id': 'e1', 'action': 'a'}])
+            assert log.flush() == 0
+            assert log.pending() == 1
+        finally:
+            writer.kill()
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/stat'), reason='needs /proc for process start times')
+def test_reused_pid_does_not_hide_a_dead_writers_segment(log, table, tmp_path):
+    with subprocess.Popen(['sleep', '30']) as newcomer:
+        try:
+            # Stamped long before this live process started: an earlier process with the same pid
+            write_segment(tmp_path, f"audit-{newcomer.pid}-{stamp(-3600)}-1.open", [{'event_id': 'e1', 'action': 'a'}])
+            assert log.flush() == 1
+        finally:
+            newcomer.kill()
+
+
+def test_own_pid_with_an_older_stamp_is_claimed(log, table, tmp_path):
+    log.record('user.toggle_status')
+    # Left by an earlier process that had this pid, e.g. before a container restart
+    write_segment(tmp_path, f"audit-{os.getpid()}-{stamp(-3600)}-1.open", [{'event_id': 'old', 'action': 'a'}])
+    assert log.flush() == 2
+    assert 'old' in table.rows
+
+
+def test_failed_insert_returns_the_segment_for_retry(log, table, tmp_path):
+    event_id = log.record('payment.create')
+    table.fail = True
+    with pytest.raises(RuntimeError):
+        log.flush()
+    assert [name.endswith('.ready') for name in os.listdir(tmp_path)] == [True]
+
+    table.fail = False
+    assert log.flush() == 1
+    assert event_id in table.rows
@@ -0,0 +1,80 @@
+import os
+import threading
+
+import pytest
+from sqlalchemy import create_engine
+
+from counters import ensure_counter, next_value
+
+
+def engines():
+    yield 'sqlite'
+    # Row locking under READ COMMITTED is what matters in production
+    if os.environ.get('TEST_POSTGRES_URL'):
+        yield 'postgres'
+
+
+@pytest.fixture(params=list(engines()))
+def engine(request, tmp_path):
+    if request.param == 'sqlite':
+        engine = create_engine(f"sqlite:///{tmp_path / 'counters.db'}")
+    else:
+        engine = create_engine(os.environ['TEST_POSTGRES_URL'])
+        with engine.begin() as connection:
+            connection.exec_driver_sql('DROP TABLE IF EXISTS counters')
+    yield engine
+    engine.dispose()
+
+
+def test_counter_starts_after_the_given_value(engine):
+    with engine.begin() as connection:
+        ensure_counter(connection, 'revision', start=41)
+        # A second worker starting up does not reset it
+        ensure_counter(connection, 'revision', start=0)
+    with engine.begin() as connection:
+        assert next_value(connection, 'revision') == 42
+        assert next_value(connection, 'revision') == 43
+
+
+def test_missing_counter_raises(engine):
+    with engine.begin() as connection:
+        ensure_counter(connection, 'revision')
+        with pytest.raises(LookupError):
+            next_value(connection, 'other')
+
+
+def test_rolled_back_value_is_not_reused_as_a_duplicate(engine):
+    with engine.begin() as connection:
+        ensure_counter(connection, 'revision')
+    with engine.connect() as connection:
+        with connection.begin() as transaction:
+            assert next_value(connection, 'revision') == 1
+            transaction.rollback()
+    with engine.begin() as connection:
+        assert next_value(connection, 'revision') == 1
+
+
+def test_interleaved_bumps_get_distinct_values_in_commit_order(engine):
+    with engine.begin() as connection:
+        ensure_counter(connection, 'revision', start=10)
+
+    first = engine.connect()
+    transaction = first.begin()
+    first_value = next_value(first, 'revision')
+
+    second = {}
+
+    def bump():
+        with engine.begin() as connection:
+            second['value'] = next_value(connection, 'revision')
+
+    thread = threading.Thread(target=bump)
+    thread.start()
+    thread.join(0.5)
+    # The second bump waits for the first transaction to finish
+    assert thread.is_alive()
+
+    transaction.commit()
+    first.close()
+    thread.join(10)
+    assert (first_value, second['value']) == (11, 12)
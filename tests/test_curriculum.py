@@ -0,0 +1,58 @@
+from curriculum import CurriculumCache, build_tree
+
+# id, title, week_number, day_number, order, duration, content_type
+ROWS = [
+    (3, 'Intro', None, None, 1, None, 'youtube'),
+    (1, 'Counting', 1, 1, 1, 30, 'youtube'),
+    (2, 'Adding', 1, 1, 2, 15, 'pdf'),
+    (4, 'Fractions', 1, 2, 1, 20, 'video'),
+    (5, 'Decimals', 2, 1, 1, 45, 'pdf'),
+]
+
+
+def test_build_tree_groups_weeks_and_days():
+    tree = build_tree(7, ROWS)
+    assert [week['title'] for week in tree['weeks']] == ['Unscheduled', 'Week 1', 'Week 2']
+
+    week1 = tree['weeks'][1]
+    assert [day['number'] for day in week1['days']] == [1, 2]
+    assert [lesson['id'] for lesson in week1['days'][0]['lessons']] == [1, 2]
+    assert (week1['lesson_count'], week1['minutes'], week1['days'][0]['minutes']) == (3, 65, 45)
+
+    assert tree['by_week']['Week 2'][0]['title'] == 'Decimals'
+    assert tree['first_lesson_id'] == 3
+    assert tree['lesson_ids'] == {1, 2, 3, 4, 5}
+    assert (tree['lesson_count'], tree['total_minutes']) == (5, 110)
+
+
+def test_build_tree_of_an_empty_subject():
+    tree = build_tree(7, [])
+    assert tree['weeks'] == [] and tree['first_lesson_id'] is None
+    assert (tree['lesson_count'], tree['total_minutes']) == (0, 0)
+
+
+def test_cache_rebuilds_only_when_the_revision_changes():
+    cache = CurriculumCache()
+    loads = []
+
+    def load():
+        loads.append(1)
+        return ROWS
+
+    first = cache.get(7, 1, load)
+    assert cache.get(7, 1, load) is first
+    assert len(loads) == 1
+
+    assert cache.get(7, 2, load) is not first
+    assert len(loads) == 2
+    assert cache.stats() == {'trees': 1, 'hits': 1, 'misses': 2}
+
+
+def test_invalidate():
+    cache = CurriculumCache()
+    cache.get(1, 1, lambda: ROWS)
+    cache.get(2, 1, lambda: ROWS)
+    cache.invalidate(1)
+    assert cache.stats()['trees'] == 1
+    cache.invalidate()
+    assert cache.stats()['trees'] == 0
@@ -0,0 +1,128 @@
+import io
+import hashlib
+import zipfile
+
+import pytest
+
+import lesson_import
+from media_storage import LocalBlobStore
+from lesson_import import DirectoryMedia, ManifestError, load_manifest, open_media, prepare_media
+
+CSV = """﻿Subject, Title ,Week,Day,file
+MATH, Fractions ,1,2,maths/fractions.pdf
+"""
+
+
+def test_csv_manifest_rows_are_normalised():
+    rows = load_manifest(io.BytesIO(CSV.encode('utf-8')), 'lessons.csv')
+    assert rows == [{'subject': 'MATH', 'title': 'Fractions', 'week': '1', 'day': '2', 'file': 'maths/fractions.pdf'}]
+
+
+def test_json_manifest_accepts_a_list_or_lessons_key():
+    lessons = [{'subject': 'MATH', 'title': 'Fractions', 'week': 1, 'day': 2}]
+    assert load_manifest(io.StringIO('{"lessons": [{"Subject": "MATH", "title": "Fractions", "week": 1, "day": 2}]}'),
+                         'lessons.JSON') == lessons
+    assert load_manifest(io.StringIO('[{"subject": "MATH", "title": "Fractions", "week": 1, "day": 2}]'),
+                         'lessons.json') == lessons
+
+
+def test_yaml_manifest():
+    pytest.importorskip('yaml')
+    rows = load_manifest(io.StringIO('lessons:\n  - subject: MATH\n    title: Fractions\n    week: 1\n    day: 2\n'),
+                         'lessons.yml')
+    assert rows == [{'subject': 'MATH', 'title': 'Fractions', 'week': 1, 'day': 2}]
+
+
+@pytest.mark.parametrize('filename, content, message', [
+    ('lessons.txt', 'subject,title', 'Unsupported manifest format'),
+    ('lessons', 'subject,title', 'Unsupported manifest format'),
+    ('lessons.json', '[{"subject": ', 'Invalid JSON'),
+    ('lessons.json', '{"items": []}', 'must be a list'),
+    ('lessons.json', '["MATH", "CHEM"]', 'must be a list'),
+    ('lessons.json', '42', 'must be a list'),
+])
+def test_bad_manifests_raise_manifest_error(filename, content, message):
+    with pytest.raises(ManifestError, match=message):
+        load_manifest(io.StringIO(content), filename)
+
+
+def test_invalid_yaml_raises_manifest_error():
+    pytest.importorskip('yaml')
+    with pytest.raises(ManifestError, match='Invalid YAML'):
+        load_manifest(io.StringIO('lessons: [unclosed'), 'lessons.yaml')
+
+
+def test_yaml_without_pyyaml(monkeypatch):
+    monkeypatch.setattr(lesson_import, 'yaml', None)
+    with pytest.raises(ManifestError, match='PyYAML'):
+        load_manifest(io.StringIO('lessons: []'), 'lessons.yaml')
+
+
+def test_directory_media_refuses_names_outside_the_root(tmp_path):
+    (tmp_path / 'media').mkdir()
+    (tmp_path / 'media' / 'a.pdf').write_bytes(b'pdf')
+    (tmp_path / 'secret.txt').write_text('no')
+    media = DirectoryMedia(str(tmp_path / 'media'))
+    assert media.exists('a.pdf')
+    assert not media.exists('../secret.txt')
+    assert not media.exists('/etc/passwd')
+
+
+def test_open_media_reads_zip_members(tmp_path):
+    archive = tmp_path / 'media.zip'
+    with zipfile.ZipFile(archive, 'w') as zf:
+        zf.writestr('week1/a.pdf', b'first')
+        zf.writestr('week1/', b'')
+    media = open_media(str(archive))
+    try:
+        assert media.exists('week1/a.pdf')
+        assert not media.exists('week1/')
+        with media.open('week1/a.pdf') as f:
+            assert f.read() == b'first'
+    finally:
+        media.close()
+
+
+def test_open_media_rejects_other_files(tmp_path):
+    path = tmp_path / 'notes.txt'
+    path.write_text('not media')
+    with pytest.raises(ManifestError):
+        open_media(str(path))
+
+
+def test_prepare_media_hashes_each_file_once(tmp_path):
+    (tmp_path / 'a.pdf').write_bytes(b'first')
+    (tmp_path / 'b.pdf').write_bytes(b'second')
+    checksums = prepare_media(DirectoryMedia(str(tmp_path)), ['a.pdf', 'b.pdf', 'a.pdf'], workers=2)
+    assert checksums == {'a.pdf': hashlib.sha256(b'first').hexdigest(),
+                         'b.pdf': hashlib.sha256(b'second').hexdigest()}
+
+
+def test_prepare_media_reports_unreadable_files(tmp_path):
+    (tmp_path / 'a.pdf').write_bytes(b'first')
+    with pytest.raises(ManifestError, match='missing.pdf'):
+        prepare_media(DirectoryMedia(str(tmp_path)), ['a.pdf', 'missing.pdf'])
+
+
+def stamp(path):
+    with open(path, 'ab') as f:
+        f.write(b'-prepared')
+    return True
+
+
+def test_staging_prepares_the_file_before_naming_it(tmp_path):
+    (tmp_path / 'media').mkdir()
+    (tmp_path / 'media' / 'a.pdf').write_bytes(b'first')
+    (tmp_path / 'media' / 'b.txt').write_bytes(b'second')
+    store = LocalBlobStore(str(tmp_path / 'store'), preparers={'pdf': stamp})
+    media = DirectoryMedia(str(tmp_path / 'media'))
+
+    planned = prepare_media(media, ['a.pdf', 'b.txt'], store=store, keep=False)
+    assert planned == {'a.pdf': hashlib.sha256(b'first-prepared').hexdigest(),
+                       'b.txt': hashlib.sha256(b'second').hexdigest()}
+    assert list((tmp_path / 'store').iterdir()) == []
+
+    blobs = prepare_media(media, ['a.pdf', 'b.txt'], store=store)
+    assert {name: blob.checksum for name, blob in blobs.items()} == planned
+    name = store.commit(blobs['a.pdf'])
+    assert (tmp_path / 'store' / name).read_bytes() == b'first-prepared'
@@ -0,0 +1,65 @@
+import os
+
+import pytest
+from botocore.exceptions import ClientError
+
+from media_storage import RangeNotSatisfiable, S3BlobStore
+
+
+def blob_name(n):
+    return f'{n:064x}.pdf'
+
+
+def client_error(code):
+    return ClientError({'Error': {'Code': code}}, 'GetObject')
+
+
+class FakeClient:
+    def __init__(self, objects):
+        self.objects = objects
+        self.downloads = []
+
+    def download_file(self, bucket, key, path):
+        self.downloads.append(key)
+        if key not in self.objects:
+            raise client_error('404')
+        with open(path, 'wb') as f:
+            f.write(self.objects[key])
+
+    def get_object(self, Bucket, Key, Range=None):
+        if Key not in self.objects:
+            raise client_error('NoSuchKey')
+        raise client_error('InvalidRange')
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = S3BlobStore(str(tmp_path), bucket='media', region='us-east-1', cache_bytes=25)
+    store.client = FakeClient({blob_name(n): b'x' * 10 for n in range(4)})
+    return store
+
+
+def test_local_copies_are_downloaded_once(store):
+    assert open(store.local_path(blob_name(0)), 'rb').read() == b'x' * 10
+    store.local_path(blob_name(0))
+    assert store.client.downloads == [blob_name(0)]
+
+
+def test_least_recently_used_copies_are_evicted(store, tmp_path):
+    first, second = store.local_path(blob_name(0)), store.local_path(blob_name(1))
+    os.utime(first, (1, 1))
+    os.utime(second, (2, 2))
+    store.local_path(blob_name(0))
+    store.local_path(blob_name(2))
+    assert sorted(os.listdir(tmp_path)) == [blob_name(0), blob_name(2)]
+
+
+def test_missing_blob_has_no_local_copy(store):
+    assert not os.path.exists(store.local_path(blob_name(9)))
+
+
+def test_stream_errors_are_mapped(store):
+    with pytest.raises(FileNotFoundError):
+        store.open_stream(blob_name(9))
+    with pytest.raises(RangeNotSatisfiable):
+        store.open_stream(blob_name(0), 'bytes=100-')
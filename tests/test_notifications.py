@@ -0,0 +1,115 @@
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import notifications
+from notifications import Channel, FileChannel, Throttle, create_channels, retry_delay
+
+
+@pytest.mark.parametrize('attempts, expected', [(0, 30), (1, 30), (2, 60), (3, 120), (6, 960)])
+def test_retry_delay_doubles_with_jitter(attempts, expected):
+    for _ in range(20):
+        assert expected * 0.8 <= retry_delay(attempts) <= expected * 1.2
+
+
+def test_retry_delay_is_capped():
+    assert retry_delay(50) <= 6 * 3600 * 1.2
+    assert retry_delay(4, base=10, cap=25) <= 25 * 1.2
+
+
+def test_throttle_spaces_calls(monkeypatch):
+    clock = [100.0]
+    slept = []
+
+    def sleep(seconds):
+        slept.append(seconds)
+        clock[0] += seconds
+
+    monkeypatch.setattr(notifications, 'time', SimpleNamespace(monotonic=lambda: clock[0], sleep=sleep))
+    throttle = Throttle(rate=4)
+    for _ in range(5):
+        throttle.wait()
+    assert slept == pytest.approx([0.25, 0.25, 0.25, 0.25])
+
+
+def test_throttle_does_not_bank_idle_time(monkeypatch):
+    clock = [100.0]
+    slept = []
+    monkeypatch.setattr(notifications, 'time', SimpleNamespace(monotonic=lambda: clock[0], sleep=slept.append))
+    throttle = Throttle(rate=2)
+    throttle.wait()
+    clock[0] += 60
+    throttle.wait()
+    throttle.wait()
+    assert slept == pytest.approx([0.5])
+
+
+def test_unthrottled_never_sleeps(monkeypatch):
+    monkeypatch.setattr(notifications, 'time', SimpleNamespace(monotonic=time.monotonic,
+                                                               sleep=lambda seconds: pytest.fail('slept')))
+    throttle = Throttle(None)
+    for _ in range(100):
+        throttle.wait()
+
+
+class FlakyChannel(Channel):
+    def __init__(self):
+        super().__init__('sms')
+        self.sent = []
+
+    def send(self, connection, message):
+        if message['recipient'] == 'bad':
+            raise ValueError('invalid number')
+        self.sent.append(message['id'])
+
+
+class UnreachableChannel(Channel):
+    def open(self):
+        raise ConnectionRefusedError('gateway down')
+
+
+def message(id, recipient='0888000000'):
+    return {'id': id, 'recipient': recipient, 'subject': None, 'body': 'Hello'}
+
+
+def test_one_failed_message_does_not_fail_the_batch():
+    channel = FlakyChannel()
+    results = channel.send_batch([message(1), message(2, 'bad'), message(3)])
+    assert results == {1: None, 2: 'ValueError: invalid number', 3: None}
+    assert channel.sent == [1, 3]
+
+
+def test_connection_failure_fails_every_message():
+    results = UnreachableChannel('email').send_batch([message(1), message(2)])
+    assert results == {1: 'ConnectionRefusedError: gateway down', 2: 'ConnectionRefusedError: gateway down'}
+
+
+def test_file_channel_appends_json_lines(tmp_path):
+    channel = FileChannel('email', directory=str(tmp_path))
+    assert channel.send_batch([message(1), message(2)]) == {1: None, 2: None}
+    lines = (tmp_path / 'email.ndjson').read_text().splitlines()
+    assert [json.loads(line)['id'] for line in lines] == [1, 2]
+
+
+def test_create_channels_by_backend(tmp_path):
+    channels = create_channels({'NOTIFY_EMAIL_BACKEND': 'file', 'NOTIFY_SMS_BACKEND': 'off',
+                                'NOTIFY_FILE_DIR': str(tmp_path), 'NOTIFY_EMAIL_RATE': 5})
+    assert list(channels) == ['email']
+    assert channels['email'].backend == 'file'
+    assert channels['email'].throttle.interval == pytest.approx(0.2)
+
+
+def test_http_sms_needs_a_gateway_url(monkeypatch):
+    monkeypatch.delenv('SMS_GATEWAY_URL', raising=False)
+    with pytest.raises(ValueError):
+        create_channels({'NOTIFY_EMAIL_BACKEND': 'off', 'NOTIFY_SMS_BACKEND': 'http'})
+
+
+def test_throttle_holds_its_rate_in_real_time():
+    throttle = Throttle(rate=50)
+    started = time.monotonic()
+    for _ in range(11):
+        throttle.wait()
+    assert time.monotonic() - started >= 0.19
@@ -0,0 +1,24 @@
+import pdf_pages
+
+CHECKSUM = 'ab' * 32
+
+
+def test_blob_pages_are_keyed_by_checksum(tmp_path):
+    assert pdf_pages.source_key(str(tmp_path / f'{CHECKSUM}.pdf')) == CHECKSUM
+    assert pdf_pages.cached_page_path('cache', f'{CHECKSUM}.pdf', 3, 800) == f'cache/{CHECKSUM}/p3-w800.jpg'
+
+
+def test_blob_pages_are_purged_without_the_blob(tmp_path):
+    pages = tmp_path / CHECKSUM
+    pages.mkdir()
+    (pages / 'p1-w800.jpg').write_bytes(b'jpeg')
+    pdf_pages.purge_pages(str(tmp_path), f'{CHECKSUM}.pdf')
+    assert not pages.exists()
+
+
+def test_other_files_are_keyed_by_version(tmp_path):
+    path = tmp_path / 'handout.pdf'
+    path.write_bytes(b'one')
+    before = pdf_pages.source_key(str(path))
+    path.write_bytes(b'second')
+    assert pdf_pages.source_key(str(path)) != before
@@ -0,0 +1,55 @@
+import os
+import sys
+import subprocess
+
+import pytest
+
+from profiler import ProfileSession
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def busy(seconds):
+    import time
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        sum(range(1000))
+
+
+def test_sampler_records_the_request_stack():
+    session = ProfileSession(0.001)
+    busy(0.05)
+    session.stop()
+    assert any('busy' in stack for stack in session.samples)
+    assert session.top_functions()
+
+
+GEVENT_REQUEST = """
+from gevent import monkey; monkey.patch_all()
+import sys, time, gevent
+sys.path.insert(0, {root!r})
+from profiler import ProfileSession
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        sum(range(1000))
+
+def request():
+    session = ProfileSession(0.001)
+    busy(0.05)
+    time.sleep(0.02)
+    session.stop()
+    return session
+
+session = gevent.spawn(request).get()
+assert any('busy' in stack for stack in session.samples), session.samples
+print('ok')
+"""
+
+
+def test_sampler_records_the_greenlet_stack_under_gevent():
+    pytest.importorskip('gevent')
+    result = subprocess.run([sys.executable, '-c', GEVENT_REQUEST.format(root=ROOT)],
+                            capture_output=True, text=True, timeout=60)
+    assert result.stdout.strip() == 'ok', result.stderr
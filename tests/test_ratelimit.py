@@ -0,0 +1,119 @@
+import multiprocessing
+from types import SimpleNamespace
+
+import pytest
+
+import ratelimit
+from ratelimit import RateLimiter, SharedBucketStore, parse_limit
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(ratelimit, 'time', SimpleNamespace(monotonic=lambda: now.value))
+    return now
+
+
+def test_parse_limit():
+    limit = parse_limit('ip:10/minute:post,Get')
+    assert (limit.scope, limit.count, limit.period) == ('ip', 10, 60)
+    assert limit.methods == {'POST', 'GET'}
+    assert parse_limit('user:5/hour').methods is None
+
+
+@pytest.mark.parametrize('spec', ['ip:10', 'host:10/minute', 'ip:10/fortnight', 'ip:10/minute:GET:POST'])
+def test_parse_limit_rejects_bad_specs(spec):
+    with pytest.raises(ValueError):
+        parse_limit(spec)
+
+
+def test_bucket_allows_burst_then_refills():
+    store = SharedBucketStore(slots=64)
+    assert [store.take('k', 3, 60, now=0)[0] for _ in range(3)] == [True, True, True]
+
+    allowed, retry_after = store.take('k', 3, 60, now=0)
+    assert not allowed
+    assert retry_after == pytest.approx(20)  # one token every 60/3 seconds
+
+    assert store.take('k', 3, 60, now=19)[0] is False
+    assert store.take('k', 3, 60, now=40)[0] is True
+
+
+def test_bucket_never_refills_past_its_size():
+    store = SharedBucketStore(slots=64)
+    store.take('k', 2, 1, now=0)
+    results = [store.take('k', 2, 1, now=3600)[0] for _ in range(3)]
+    assert results == [True, True, False]
+
+
+def test_buckets_are_independent_per_key():
+    store = SharedBucketStore(slots=64)
+    assert store.take('a', 1, 60, now=0)[0]
+    assert not store.take('a', 1, 60, now=0)[0]
+    assert store.take('b', 1, 60, now=0)[0]
+
+
+def test_full_table_reuses_the_longest_idle_slot():
+    store = SharedBucketStore(slots=ratelimit.PROBES)
+    for index in range(ratelimit.PROBES * 4):
+        store.take(f"key-{index}", 1, 60, now=index)
+    assert store.occupancy() == ratelimit.PROBES
+
+
+def test_check_returns_whole_seconds_to_wait(clock):
+    limiter = RateLimiter({'login': ['ip:2/minute:POST']}, slots=64)
+    assert limiter.check('login', 'POST', '10.0.0.1') is None
+    assert limiter.check('login', 'POST', '10.0.0.1') is None
+    assert limiter.check('login', 'POST', '10.0.0.1') == 30
+
+    clock.value += 29.5
+    assert limiter.check('login', 'POST', '10.0.0.1') == 1
+    clock.value += 1
+    assert limiter.check('login', 'POST', '10.0.0.1') is None
+
+
+def test_check_skips_other_methods_and_endpoints(clock):
+    limiter = RateLimiter({'login': ['ip:1/minute:POST']}, slots=64)
+    for _ in range(5):
+        assert limiter.check('login', 'GET', '10.0.0.1') is None
+        assert limiter.check('index', 'POST', '10.0.0.1') is None
+
+
+def test_user_scope_keys_by_user_and_falls_back_to_ip(clock):
+    limiter = RateLimiter({'download': ['user:1/minute']}, slots=64)
+    assert limiter.check('download', 'GET', '10.0.0.1', user_id=1) is None
+    # Same user from another address shares the bucket
+    assert limiter.check('download', 'GET', '10.0.0.2', user_id=1) is not None
+    assert limiter.check('download', 'GET', '10.0.0.1', user_id=2) is None
+    assert limiter.check('download', 'GET', '10.0.0.3') is None
+    assert limiter.check('download', 'GET', '10.0.0.3') is not None
+
+
+def test_longest_wait_wins_across_rules(clock):
+    limiter = RateLimiter({'login': ['ip:1/minute', 'ip:1/hour']}, slots=64)
+    limiter.check('login', 'POST', '10.0.0.1')
+    assert limiter.check('login', 'POST', '10.0.0.1') == 3600
+
+
+def test_stats_count_allowed_and_limited(clock):
+    limiter = RateLimiter({'login': ['ip:1/minute']}, slots=64)
+    for _ in range(3):
+        limiter.check('login', 'POST', '10.0.0.1')
+    stats = limiter.stats()
+    assert stats['rules'] == [{'endpoint': 'login', 'limit': 'ip:1/minute', 'allowed': 1, 'limited': 2}]
+    assert stats['buckets_in_use'] == 1
+
+
+def _take_in_child(store):
+    store.take('shared', 2, 3600)
+
+
+def test_forked_workers_share_buckets():
+    store = SharedBucketStore(slots=64)
+    child = multiprocessing.get_context('fork').Process(target=_take_in_child, args=(store,))
+    child.start()
+    child.join(10)
+    assert child.exitcode == 0
+
+    assert store.take('shared', 2, 3600)[0] is True
+    assert store.take('shared', 2, 3600)[0] is False